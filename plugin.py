@@ -53,7 +53,7 @@ import webbrowser
 
 from galaxyutils.time_tracker import TimeTracker, GameNotTrackedException, GamesStillBeingTrackedException
 
-from wgc import WGC, WgcLauncher, WGCLocalApplication, PAPIWoT, WgcXMPP, get_profile_url
+from wgc import WGC, WgcLauncher, WGCLocalApplication, PAPIWoT, WgcXMPP, BackendUnavailableError, get_profile_url
 
 class WargamingPlugin(Plugin):
     """
@@ -82,11 +82,19 @@ class WargamingPlugin(Plugin):
 
     SLEEP_CHECK_INSTANCES = 30
 
+    OWNED_GAMES_CACHE_KEY = 'owned_games_cache'
+
+    #bounds of the owned games refresh interval in seconds
+    OWNED_GAMES_REFRESH_MIN = 300
+    OWNED_GAMES_REFRESH_MAX = 3600
+
+    HTTP_CACHE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'cache/http/')
+
 
     def __init__(self, reader, writer, token):
         super().__init__(Platform(manifest['platform']), manifest['version'], reader, writer, token)
 
-        self._wgc = WGC()
+        self._wgc = WGC(self.HTTP_CACHE_DIR)
         self._xmpp = dict()
 
         #intialized flag
@@ -97,6 +105,10 @@ class WargamingPlugin(Plugin):
         self.__gametime_tracker = None
 
         self.__task_check_for_instances_obj = None
+        self.__task_refresh_owned_games_obj = None
+        self.__owned_games_refresh_interval = self.OWNED_GAMES_REFRESH_MIN
+        self.__owned_games_imported = False
+        self.__owned_games = dict()
         self.__local_games_states = dict()
         self.__local_applications = dict()
 
@@ -153,14 +165,29 @@ class WargamingPlugin(Plugin):
     #
 
     async def get_owned_games(self) -> List[Game]:     
-        owned_applications = list()
-
         wgni = self._wgc.get_wgni_client()
-        for instance in (await self._wgc.get_owned_applications(wgni.get_account_realm())).values():
-            license_info = LicenseInfo(LicenseType.SinglePurchase if instance.is_application_purchased() else LicenseType.FreeToPlay, None)
-            owned_applications.append(Game(instance.get_application_id(), instance.get_application_fullname(), None, license_info))
 
-        return owned_applications
+        #serve catalog from the previous run, the fresh one is applied as a diff in background
+        instances = self.__owned_games_load_cache(wgni.get_account_realm())
+        if instances is not None:
+            logging.info('plugin/get_owned_games: returning %s cached games' % len(instances))
+            if self.__task_refresh_owned_games_obj and not self.__task_refresh_owned_games_obj.done():
+                self.__task_refresh_owned_games_obj.cancel()
+            self.__task_refresh_owned_games_obj = self.create_task(self.__task_refresh_owned_games(0), "task_refresh_owned_games")
+        else:
+            try:
+                instances = await self._wgc.get_owned_applications(wgni.get_account_realm())
+            except BackendUnavailableError:
+                logging.warning('plugin/get_owned_games: backend is temporarily unavailable')
+                raise BackendError()
+
+            if self._wgc.is_owned_applications_complete():
+                self.__owned_games_save_cache()
+            logging.debug('plugin/get_owned_games: http stats %s' % json.dumps(self._wgc.get_http_stats()))
+
+        self.__owned_games = {game_id: instance.get_content_hash() for game_id, instance in instances.items()}
+        self.__owned_games_imported = True
+        return [self.__owned_games_create_game(instance) for instance in instances.values()]
 
     #
     # ImportInstalledGames
@@ -193,13 +220,21 @@ class WargamingPlugin(Plugin):
             webbrowser.open(self._wgc.get_wgc_install_url())
             return
 
+        #owned games are known after import, the catalog is fetched only if the game has been bought since the last refresh
         wgni = self._wgc.get_wgni_client()
-        instances = await self._wgc.get_owned_applications(wgni.get_account_realm())
-        if game_id not in instances:
+        instance = self._wgc.get_owned_application(game_id, wgni.get_account_realm())
+        if instance is None:
+            try:
+                instance = (await self._wgc.get_owned_applications(wgni.get_account_realm())).get(game_id)
+            except BackendUnavailableError:
+                logging.warning('plugin/install_games: backend is temporarily unavailable')
+                raise BackendError()
+
+        if instance is None:
             logging.warning('plugin/install_games: failed to find the application with id %s' % game_id)
             raise BackendError()
         
-        await instances[game_id].install_application()
+        await instance.install_application()
 
     #
     # UninstallGame
@@ -251,6 +286,9 @@ class WargamingPlugin(Plugin):
         game_restrictions = self._wgc.get_game_restrictions()
         current_platform = get_platform()
 
+        #restrictions file is parsed once for all games
+        allowed_ids = set(game_restrictions.get_allowed_ids()) if current_platform != 'windows' and game_restrictions else set()
+
         for game_id in game_ids:
             #populate from local app
             if game_id in self.__local_applications:
@@ -261,9 +299,8 @@ class WargamingPlugin(Plugin):
             result[game_id] = ['windows']
 
             #populate from game restriction for non-windows platform
-            if current_platform != 'windows' and game_restrictions:
-                if game_id in game_restrictions.get_allowed_ids():
-                    result[game_id].append(current_platform)
+            if game_id in allowed_ids:
+                result[game_id].append(current_platform)
 
         return result
 
@@ -318,6 +355,10 @@ class WargamingPlugin(Plugin):
             if not self.__task_check_for_instances_obj or self.__task_check_for_instances_obj.done():
                 self.__task_check_for_instances_obj = self.create_task(self.__task_check_for_instances(), "task_check_for_instances")
 
+        if self.__handshake_completed and self.__owned_games_imported:
+            if not self.__task_refresh_owned_games_obj or self.__task_refresh_owned_games_obj.done():
+                self.__task_refresh_owned_games_obj = self.create_task(self.__task_refresh_owned_games(self.__owned_games_refresh_interval), "task_refresh_owned_games")
+
     async def shutdown(self) -> None:
         await self._wgc.shutdown()
 
@@ -389,6 +430,89 @@ class WargamingPlugin(Plugin):
             #notify GLX client
             self.update_local_game_status(LocalGame(game_id, new_state))
 
+    #
+    # Internals/Owned games
+    #
+
+    def __owned_games_create_game(self, instance) -> Game:
+        license_info = LicenseInfo(LicenseType.SinglePurchase if instance.is_application_purchased() else LicenseType.FreeToPlay, None)
+        return Game(instance.get_application_id(), instance.get_application_fullname(), None, license_info)
+
+    def __owned_games_load_cache(self, realm: str) -> Optional[Dict]:
+        if self.OWNED_GAMES_CACHE_KEY not in self.persistent_cache:
+            return None
+
+        try:
+            cache = json.loads(self.persistent_cache[self.OWNED_GAMES_CACHE_KEY])
+        except Exception:
+            logging.exception('plugin/__owned_games_load_cache: failed to parse cache')
+            return None
+
+        return self._wgc.load_owned_applications_cache(cache, realm)
+
+    def __owned_games_save_cache(self) -> None:
+        cache = self._wgc.get_owned_applications_cache()
+        if cache is None:
+            return
+
+        self.persistent_cache[self.OWNED_GAMES_CACHE_KEY] = json.dumps(cache, separators = (',', ':'))
+        self.push_cache()
+
+    async def __task_refresh_owned_games(self, delay: float):
+        await asyncio.sleep(delay)
+
+        changed = await self.__owned_games_refresh()
+
+        #refresh often while the catalog changes or right after purchases, back off while it stays the same
+        if changed:
+            self.__owned_games_refresh_interval = self.OWNED_GAMES_REFRESH_MIN
+        else:
+            self.__owned_games_refresh_interval = min(self.__owned_games_refresh_interval * 2, self.OWNED_GAMES_REFRESH_MAX)
+
+    async def __owned_games_refresh(self) -> bool:
+        '''
+        fetches catalog and notifies GLX client about the difference, returns True if anything has changed
+        '''
+        wgni = self._wgc.get_wgni_client()
+        try:
+            instances = await self._wgc.get_owned_applications(wgni.get_account_realm())
+        except BackendUnavailableError:
+            logging.warning('plugin/__owned_games_refresh: backend is temporarily unavailable, keeping known games')
+            return False
+
+        #free-to-play games are always owned, so empty list means that the backend has failed
+        if not instances:
+            logging.warning('plugin/__owned_games_refresh: received empty catalog, keeping known games')
+            return False
+
+        owned_games = {game_id: instance.get_content_hash() for game_id, instance in instances.items()}
+
+        #products missing from partial catalog may still be owned, so nothing is removed and the cache is kept
+        is_complete = self._wgc.is_owned_applications_complete()
+        if not is_complete:
+            logging.warning('plugin/__owned_games_refresh: received partial catalog, only additions and updates are applied')
+            owned_games = {**self.__owned_games, **owned_games}
+
+        #unchanged instances are skipped by their content hash
+        games_removed = self.__owned_games.keys() - owned_games.keys()
+        games_added = owned_games.keys() - self.__owned_games.keys()
+        games_updated = [game_id for game_id in owned_games.keys() & self.__owned_games.keys() if owned_games[game_id] != self.__owned_games[game_id]]
+
+        for game_id in games_removed:
+            self.remove_game(game_id)
+        for game_id in games_added:
+            self.add_game(self.__owned_games_create_game(instances[game_id]))
+        for game_id in games_updated:
+            self.update_game(self.__owned_games_create_game(instances[game_id]))
+
+        self.__owned_games = owned_games
+        if is_complete:
+            self.__owned_games_save_cache()
+
+        logging.info('plugin/__owned_games_refresh: %s games added, %s removed, %s updated' % (len(games_added), len(games_removed), len(games_updated)))
+        logging.debug('plugin/__owned_games_refresh: http stats %s' % json.dumps(self._wgc.get_http_stats()))
+        return bool(games_removed or games_added or games_updated)
+
     #
     # Internals/XMPP
     #
@@ -0,0 +1,49 @@
+# (c) 2019-2020 Mikhail Paulyshka
+# SPDX-License-Identifier: MIT
+
+import random
+
+import pytest
+
+from wgc.wgc_keccak import Keccak512Flat, Keccak512Reference, KeccakFlatState, KeccakState, hexlify, keccak_f, keccak_f1600_flat
+
+#Keccak-512 with original padding (not SHA3-512), from the Keccak team known answers
+KNOWN_ANSWERS = [
+    (b'', '0eab42de4c3ceb9235fc91acffe746b29c29a8c366b7c60e4e67c466f36a4304'
+          'c00fa9caf9d87976ba469bcbe06713b435f091ef2769fb160cdab33d3670680e'),
+    (b'abc', '18587dc2ea106b9a1563e32b3312421ca164c7f1f07bc922a9c83d77cea3a1e5'
+             'd0c69910739025372dc14ac9642629379540c17e2a65b19d77aa511a9d00bb96'),
+    (b'The quick brown fox jumps over the lazy dog',
+     'd135bb84d0439dbac432247ee573a23ea7d3c9deb2a968eb31d47c4fb45f1ef4'
+     '422d6c531b5b9bd6f449ebcc449ea94d0a8f05f62130fda612da53c79659f609'),
+]
+
+
+@pytest.mark.parametrize('seed', range(16))
+def test_keccak_f1600_flat_matches_reference(seed):
+    generator = random.Random(seed)
+    lanes = [generator.getrandbits(64) for _ in range(25)]
+
+    state_reference = KeccakState(576, 1600)
+    for x in range(5):
+        for y in range(5):
+            state_reference.s[x][y] = lanes[x + 5 * y]
+    keccak_f(state_reference)
+
+    state_flat = KeccakFlatState(576, 1600)
+    state_flat.s = list(lanes)
+    keccak_f1600_flat(state_flat)
+
+    assert state_flat.s == [state_reference.s[x][y] for y in range(5) for x in range(5)]
+
+
+@pytest.mark.parametrize('data, expected', KNOWN_ANSWERS)
+@pytest.mark.parametrize('factory', [Keccak512Reference, Keccak512Flat], ids = ['reference', 'flat'])
+def test_keccak512_known_answers(factory, data, expected):
+    assert hexlify(factory(data).digest()) == expected
+
+    #input fed in parts must give the same digest
+    hash_obj = factory()
+    for offset in range(0, len(data), 7):
+        hash_obj.update(data[offset:offset + 7])
+    assert hash_obj.hexdigest() == expected
@@ -0,0 +1,67 @@
+# (c) 2019-2020 Mikhail Paulyshka
+# SPDX-License-Identifier: MIT
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from wgc.wgc_api import WgcApi
+from wgc.wgc_error import BackendUnavailableError
+from wgc.wgc_http import WgcHttpResponse
+
+
+class FakeHttp:
+    '''
+    answers WGCPS, product and showroom requests, product URIs listed in failed_products return given status
+    '''
+
+    def __init__(self, products, failed_products, product_list_status = 200):
+        self.products = products
+        self.failed_products = failed_products
+        self.product_list_status = product_list_status
+
+    def get_url(self, ltype, realm, url):
+        return 'https://%s.example%s' % (ltype, url)
+
+    async def request_post_simple(self, ltype, realm, url, **kwargs):
+        if self.product_list_status != 200:
+            return self.__response(self.product_list_status, {})
+        return self.__response(200, {'data': {'product_uris': ['https://wgcps.example/product/%s' % app_id for app_id in self.products]}})
+
+    async def request_get(self, url, **kwargs):
+        if url.startswith('https://wgcps.example/product/'):
+            app_id = url.rsplit('/', 1)[1]
+            if app_id in self.failed_products:
+                return self.__response(self.failed_products[app_id], {})
+            return self.__response(200, {'metadata': {'wgc': {'application_id': {'data': app_id}, 'update_url': {'data': 'https://wgus.example'}}}})
+
+        showcase = [{'game_name': app_id, 'instances': [{'application_id': app_id, 'update_service_url': 'https://wgus.example'}]}
+                    for app_id in ['WOT.EU.PRODUCTION'] + self.products]
+        return self.__response(200, {'data': {'showcase': showcase}})
+
+    def __response(self, status, content):
+        return WgcHttpResponse(status, {}, json.dumps(content).encode('utf-8'))
+
+
+def fetch_product_list(products, failed_products, product_list_status = 200):
+    wgni = SimpleNamespace(get_account_realm = lambda: 'EU', get_account_id = lambda: 1)
+    api = WgcApi(FakeHttp(products, failed_products, product_list_status), wgni, 'DE', 'en')
+    product_list, is_complete = asyncio.run(api.fetch_product_list())
+    return sorted(instance_id for application in product_list for instance_id in application.get_application_instances()), is_complete
+
+
+def test_product_list_is_complete():
+    assert fetch_product_list(['SG1.EU.PRODUCTION', 'SG2.EU.PRODUCTION'], {}) == (['SG1.EU.PRODUCTION', 'SG2.EU.PRODUCTION', 'WOT.EU.PRODUCTION'], True)
+
+
+def test_product_list_with_failed_product_is_incomplete():
+    #circuit breaker answers skipped requests with 503
+    assert fetch_product_list(['SG1.EU.PRODUCTION', 'SG2.EU.PRODUCTION'], {'SG2.EU.PRODUCTION': 503}) == (['SG1.EU.PRODUCTION', 'WOT.EU.PRODUCTION'], False)
+
+
+def test_product_list_not_ready_before_deadline_is_unavailable():
+    #WgcHttp reports 202 polling which exceeded its deadline as 504
+    with pytest.raises(BackendUnavailableError):
+        fetch_product_list(['SG1.EU.PRODUCTION'], {}, 504)
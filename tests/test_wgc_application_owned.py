@@ -0,0 +1,51 @@
+# (c) 2019-2020 Mikhail Paulyshka
+# SPDX-License-Identifier: MIT
+
+from types import SimpleNamespace
+
+from wgc.wgc import WGC
+from wgc.wgc_application_owned import WGCOwnedApplication, WGCOwnedApplicationRegistry
+
+
+def create_registry() -> WGCOwnedApplicationRegistry:
+    registry = WGCOwnedApplicationRegistry()
+    registry.update([
+        WGCOwnedApplication('World of Tanks', [('WOT.RU.PRODUCTION', 'https://wgus-ru.example'), ('WOT.EU.PRODUCTION', 'https://wgus-eu.example')], False, None),
+        WGCOwnedApplication('Steel Hunters', [('SH.WW.PRODUCTION', 'https://wgus-ww.example')], True, None),
+    ])
+    return registry
+
+
+def test_owned_application_lookup_keeps_realm_filter():
+    #WGC is not constructed, lookup only needs the registry
+    wgc = SimpleNamespace(_WGC__owned_applications = create_registry())
+
+    assert WGC.get_owned_application(wgc, 'WOT.EU.PRODUCTION', 'EU').get_update_service_url() == 'https://wgus-eu.example'
+    assert WGC.get_owned_application(wgc, 'WOT.RU.PRODUCTION', 'EU') is None
+    assert WGC.get_owned_application(wgc, 'WOT.RU.PRODUCTION', 'RU').get_update_service_url() == 'https://wgus-ru.example'
+    assert WGC.get_owned_application(wgc, 'SH.WW.PRODUCTION', 'EU') is not None
+    assert WGC.get_owned_application(wgc, 'WOT.NA.PRODUCTION', 'NA') is None
+
+
+def test_registry_get_instance_does_not_copy_realm_index(monkeypatch):
+    registry = create_registry()
+    monkeypatch.setattr(registry, 'get_instances', None)
+
+    assert registry.get_instance('WOT.EU.PRODUCTION', 'EU') is not None
+    assert registry.get_instance('WOT.EU.PRODUCTION', 'RU') is None
+
+
+def test_registry_update_keeps_unchanged_instances():
+    registry = create_registry()
+    instance = registry.get_instances('EU')['WOT.EU.PRODUCTION']
+
+    registry.update([WGCOwnedApplication('World of Tanks', [('WOT.EU.PRODUCTION', 'https://wgus-eu.example')], False, None)])
+    assert registry.get_instances('EU') == {'WOT.EU.PRODUCTION': instance}
+    assert registry.get_instances('RU') == {}
+
+
+def test_registry_keeps_instances_missing_from_incomplete_list():
+    registry = create_registry()
+
+    registry.update([WGCOwnedApplication('World of Tanks', [('WOT.EU.PRODUCTION', 'https://wgus-eu.example')], False, None)], False)
+    assert sorted(registry.get_instances()) == ['SH.WW.PRODUCTION', 'WOT.EU.PRODUCTION', 'WOT.RU.PRODUCTION']
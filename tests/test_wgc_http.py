@@ -0,0 +1,237 @@
+# (c) 2019-2020 Mikhail Paulyshka
+# SPDX-License-Identifier: MIT
+
+import asyncio
+import time
+
+import aiohttp
+import pytest
+
+from wgc.wgc_http import WgcHttp
+from wgc.wgc_httpcache import WgcHttpCache
+
+URL_SHOWROOM = 'https://wgc.example/api/v16/content/showroom/?lang=EN'
+URL_CHALLENGE = 'https://wgnet.example/id/api/v2/account/credentials/create/oauth/token/challenge/'
+URL_TOKEN = 'https://wgnet.example/id/api/v2/account/credentials/create/oauth/token/'
+URL_PRODUCT_LIST = 'https://wgcps.example/platform/api/v1/fetchProductList'
+
+
+def run_with_http(check, responses, **kwargs):
+    '''
+    runs check(http, sent) on WgcHttp created with kwargs, network requests are answered from responses and recorded in sent,
+    exceptions are raised and coroutine functions are awaited
+    '''
+    responses = list(responses)
+    sent = list()
+
+    async def send(method, url, headers, trace_context, time_deadline, *, params = None, data = None, json = None):
+        sent.append((method, url, dict(headers)))
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        if callable(response):
+            return await response()
+        return response
+
+    async def run():
+        http = WgcHttp(**kwargs)
+        http._WgcHttp__send_once = send
+        try:
+            await check(http, sent)
+        finally:
+            await http.shutdown()
+
+    asyncio.run(run())
+    return sent
+
+
+@pytest.fixture(autouse = True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(WgcHttp, 'RETRY_BASE_DELAY', 0.0)
+
+
+def test_request_stores_and_serves_fresh_response(tmp_path):
+    async def check(http, sent):
+        response = await http.request('GET', URL_SHOWROOM, cache = True)
+        assert response.status == 200 and response.json() == {'data': 1}
+
+        response = await http.request('GET', URL_SHOWROOM, cache = True)
+        assert response.status == 200 and response.json() == {'data': 1}
+        assert len(sent) == 1
+
+    run_with_http(check, [(200, {}, b'{"data": 1}')], cache = WgcHttpCache(str(tmp_path)))
+
+    #index is written on shutdown
+    assert len(WgcHttpCache(str(tmp_path)).dump_index()) > 2
+
+
+def test_request_revalidates_cached_response(tmp_path):
+    async def check(http, sent):
+        response = await http.request('GET', URL_SHOWROOM, cache = True)
+        assert response.json() == {'data': 1}
+
+        response = await http.request('GET', URL_SHOWROOM, cache = True)
+        assert response.status == 200 and response.json() == {'data': 1}
+        assert sent[1][2]['If-None-Match'] == '"1"'
+
+    run_with_http(check, [(200, {'ETag': '"1"'}, b'{"data": 1}'), (304, {}, b'')], cache = WgcHttpCache(str(tmp_path), ttls = {}))
+
+
+def test_request_is_not_cached_unless_asked(tmp_path):
+    async def check(http, sent):
+        assert (await http.request('GET', URL_CHALLENGE)).json() == {'pow': 1}
+        assert (await http.request('GET', URL_CHALLENGE)).json() == {'pow': 2}
+        assert 'If-None-Match' not in sent[1][2]
+
+    run_with_http(check, [(200, {'ETag': '"1"'}, b'{"pow": 1}'), (200, {'ETag': '"2"'}, b'{"pow": 2}')], cache = WgcHttpCache(str(tmp_path)))
+
+
+def test_request_retries_get():
+    async def check(http, sent):
+        response = await http.request('GET', URL_CHALLENGE)
+        assert response.status == 200
+        assert len(sent) == 3
+
+    run_with_http(check, [(503, {}, b''), aiohttp.ClientError(), (200, {}, b'{}')])
+
+
+def test_request_does_not_retry_post_by_default():
+    async def check(http, sent):
+        response = await http.request_post(URL_TOKEN, data = {'otp_code': '123456'})
+        assert response.status == 503
+
+        with pytest.raises(aiohttp.ClientError):
+            await http.request_post(URL_TOKEN, data = {'otp_code': '123456'})
+        assert len(sent) == 2
+
+    run_with_http(check, [(503, {}, b''), aiohttp.ClientError()])
+
+
+def test_request_retries_post_when_asked():
+    async def check(http, sent):
+        response = await http.request_post(URL_PRODUCT_LIST, json = {}, retry = True)
+        assert response.status == 200
+        assert len(sent) == 2
+
+    run_with_http(check, [(504, {}, b''), (200, {}, b'{}')])
+
+
+def test_half_open_circuit_lets_one_probe_through(monkeypatch):
+    monkeypatch.setattr(WgcHttp, 'CIRCUIT_THRESHOLD', 1)
+    monkeypatch.setattr(WgcHttp, 'CIRCUIT_OPEN_SECONDS', 0.0)
+    probe_events = list()
+
+    async def probe_response():
+        await probe_events[0].wait()
+        return (200, {}, b'{}')
+
+    async def check(http, sent):
+        probe_events.append(asyncio.Event())
+
+        #failure opens the circuit, it becomes half-open right away
+        assert (await http.request_post(URL_TOKEN)).status == 503
+
+        probe = asyncio.ensure_future(http.request_post(URL_TOKEN))
+        while len(sent) < 2:
+            await asyncio.sleep(0)
+        assert (await http.request_post(URL_TOKEN)).status == 503
+        assert len(sent) == 2
+
+        probe_events[0].set()
+        assert (await probe).status == 200
+
+        #successful probe closes the circuit
+        assert (await http.request_post(URL_TOKEN)).status == 200
+        assert len(sent) == 3
+
+    run_with_http(check, [(503, {}, b''), probe_response, (200, {}, b'{}')])
+
+
+def test_failed_probe_opens_circuit_again(monkeypatch):
+    monkeypatch.setattr(WgcHttp, 'CIRCUIT_THRESHOLD', 1)
+
+    async def check(http, sent):
+        assert (await http.request_post(URL_TOKEN)).status == 503
+        http._WgcHttp__hosts['wgnet.example']['open_until'] = time.monotonic() - 1.0
+
+        #probe fails, so the circuit is open for the whole period again
+        assert (await http.request_post(URL_TOKEN)).status == 503
+        assert (await http.request_post(URL_TOKEN)).status == 503
+        assert len(sent) == 2
+
+    run_with_http(check, [(503, {}, b''), (503, {}, b'')])
+
+
+class FakeSession:
+    '''
+    answers every request with 202 Accepted pointing to the same location
+    '''
+
+    def __init__(self):
+        self.requests = 0
+
+    def request(self, method, url, **kwargs):
+        self.requests += 1
+        return FakeResponse()
+
+    async def close(self):
+        pass
+
+
+class FakeResponse:
+    status = 202
+    headers = {'Location': URL_PRODUCT_LIST + '/1'}
+    url = URL_PRODUCT_LIST
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def read(self):
+        return b''
+
+
+def test_poll_deadline_is_reported_as_gateway_timeout():
+    async def run():
+        http = WgcHttp(poll_initial_delay = 0.01, poll_deadline = 0.05)
+        session = FakeSession()
+        http._WgcHttp__session = session
+
+        response = await http.request_post(URL_PRODUCT_LIST, json = {})
+        assert response.status == 504
+        assert session.requests > 1
+        assert http.get_poll_stats()['POST wgcps.example/platform/api/v1/fetchProductList']['timeouts'] == 1
+
+    asyncio.run(run())
+
+
+def test_retries_and_polls_share_request_deadline():
+    async def run():
+        http = WgcHttp(poll_initial_delay = 0.01, poll_max_delay = 0.01, poll_deadline = 10.0, request_deadline = 0.1)
+        session = FakeSession()
+        http._WgcHttp__session = session
+
+        time_start = time.monotonic()
+        response = await http.request_post(URL_PRODUCT_LIST, json = {}, retry = True)
+        assert response.status == 504
+        assert time.monotonic() - time_start < 1.0
+
+    asyncio.run(run())
+
+
+def test_retry_after_is_capped(monkeypatch):
+    monkeypatch.setattr(WgcHttp, 'RETRY_MAX_DELAY', 0.01)
+    monkeypatch.setattr(FakeResponse, 'headers', {'Location': URL_PRODUCT_LIST + '/1', 'Retry-After': '3600'})
+
+    async def run():
+        http = WgcHttp(poll_deadline = 0.1)
+        session = FakeSession()
+        http._WgcHttp__session = session
+
+        response = await http.request_post(URL_PRODUCT_LIST, json = {})
+        assert response.status == 504
+        assert session.requests > 1
+
+    asyncio.run(run())
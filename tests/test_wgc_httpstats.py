@@ -0,0 +1,21 @@
+# (c) 2019-2020 Mikhail Paulyshka
+# SPDX-License-Identifier: MIT
+
+from types import SimpleNamespace
+
+from wgc.wgc_httpstats import WgcHttpPoolStats
+
+
+def test_pool_stats_reads_connector_state():
+    connector = SimpleNamespace(limit = 32, limit_per_host = 8, _conns = {'key': [1, 2]}, _acquired = {3})
+
+    stats = WgcHttpPoolStats().get_stats(connector)
+    assert (stats['open'], stats['idle'], stats['acquired']) == (3, 2, 1)
+
+
+def test_pool_stats_without_private_connector_state():
+    connector = SimpleNamespace(limit = 32, limit_per_host = 8)
+
+    stats = WgcHttpPoolStats().get_stats(connector)
+    assert (stats['open'], stats['idle'], stats['acquired']) == (None, None, None)
+    assert stats['limit'] == 32 and stats['reuse_ratio'] is None
@@ -0,0 +1,71 @@
+# (c) 2019-2020 Mikhail Paulyshka
+# SPDX-License-Identifier: MIT
+
+import asyncio
+
+from wgc.wgc_wgni import WgcWgni
+
+
+def create_wgni(solutions):
+    '''
+    returns WgcWgni whose challenges are solved by awaiting solutions[realm](progress), realms are recorded in started
+    '''
+    wgni = WgcWgni(None)
+    started = list()
+    progresses = dict()
+
+    async def challenge_get(realm):
+        return {'realm': realm, 'algorithm': {'name': 'hashcash'}, 'complexity': 1}
+
+    async def challenge_solve(challenge_data, progress):
+        started.append(challenge_data['realm'])
+        progresses[challenge_data['realm']] = progress
+        return await solutions[challenge_data['realm']](progress)
+
+    wgni._WgcWgni__oauth_challenge_get = challenge_get
+    wgni._WgcWgni__oauth_challenge_solve = challenge_solve
+    return wgni, started, progresses
+
+
+async def solve_now(progress):
+    return 42
+
+
+async def solve_never(progress):
+    await asyncio.Event().wait()
+
+
+def test_taking_presolved_realm_cancels_other_realms():
+    async def run():
+        wgni, started, progresses = create_wgni({'EU': solve_now, 'RU': solve_never})
+
+        wgni.prefetch_challenges(['EU', 'RU', 'NA'])
+        while 'RU' not in started:
+            await asyncio.sleep(0)
+
+        assert await wgni._WgcWgni__oauth_challenge_take_presolved('EU') == 42
+        assert progresses['RU'].cancelled
+        await wgni.shutdown()
+
+    asyncio.run(run())
+
+
+def test_cancel_pow_cancels_taken_presolve():
+    async def run():
+        wgni, started, progresses = create_wgni({'EU': solve_never, 'RU': solve_now})
+
+        wgni.prefetch_challenges(['EU', 'RU'])
+        take = asyncio.ensure_future(wgni._WgcWgni__oauth_challenge_take_presolved('EU'))
+        while 'EU' not in started:
+            await asyncio.sleep(0)
+
+        wgni.cancel_pow()
+        assert await take is None
+        assert progresses['EU'].cancelled
+
+        #login has started for EU, so RU is never solved
+        await asyncio.sleep(0)
+        assert started == ['EU']
+        await wgni.shutdown()
+
+    asyncio.run(run())
@@ -4,6 +4,7 @@
 from .wgc import WGC
 from .wgc_application_local import WGCLocalApplication
 from .wgc_apptype import WgcAppType
+from .wgc_error import BackendUnavailableError
 from .wgc_helper import get_profile_url
 from .wgc_launcher import WgcLauncher
 from .wgc_xmpp import WgcXMPP
@@ -14,6 +15,7 @@ from .papi_wot import PAPIWoT
 __all__ = (
     'WGC'
     'WgcAppType'
+    'BackendUnavailableError'
     'WgcLauncher'
     'WGCLocalApplication'
     'WgcXMPP'
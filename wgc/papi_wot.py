@@ -1,12 +1,14 @@
 # (c) 2019-2020 Mikhail Paulyshka
 # SPDX-License-Identifier: MIT
 
+import asyncio
 import json
 from typing import Dict, List
 
 import aiohttp
 
 from .wgc_constants import PAPI_WOT_REALMS
+from .wgc_http import WgcHttp
 from .wgc_spa import sort_by_realms
 
 class PAPIWoT(object):
@@ -14,19 +16,29 @@ class PAPIWoT(object):
     URL_WOT_ACCOUNT_INFO = 'wot/account/info/'
 
     @staticmethod
-    async def get_account_info(account_ids : List[int]) -> Dict[str, Dict[int, object]]:
-
-        info = dict()
-
+    async def get_account_info(account_ids : List[int], http : WgcHttp = None, host : str = None) -> Dict[str, Dict[int, object]]:
+        '''
+        requests account info from all realms at once, uses shared session of http client if it is given,
+        host (e.g. http://127.0.0.1:13338) replaces PAPI hosts of all realms
+        '''
+        requests = dict()
         for realm_id, realm_spa_ids in sort_by_realms(account_ids).items():
             params = dict()
             params['application_id'] = PAPI_WOT_REALMS[realm_id]['client_id']
             params['account_id'] = str.join(',', [str(spa_id) for spa_id in realm_spa_ids])
 
-            url = 'https://%s/%s' % (PAPI_WOT_REALMS[realm_id]['host'], PAPIWoT.URL_WOT_ACCOUNT_INFO)
-            
-            async with aiohttp.ClientSession().get(url, params = params) as response:
-                response_json = json.loads(await response.text())
-                info[realm_id] = response_json['data']
+            url = '%s/%s' % (host or 'https://%s' % PAPI_WOT_REALMS[realm_id]['host'], PAPIWoT.URL_WOT_ACCOUNT_INFO)
+            requests[realm_id] = PAPIWoT.__request_get(http, url, params)
 
-        return info
+        responses = await asyncio.gather(*requests.values())
+        return {realm_id: response_json['data'] for realm_id, response_json in zip(requests, responses)}
+
+    @staticmethod
+    async def __request_get(http : WgcHttp, url : str, params : Dict[str, str]) -> Dict:
+        if http is not None:
+            response = await http.request_get(url, params = params, endpoint = 'papi.wot.accountInfo')
+            return response.json()
+
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, params = params) as response:
+                return json.loads(await response.text())
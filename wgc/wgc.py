@@ -4,31 +4,35 @@
 import logging
 import os
 import subprocess
-from typing import Dict
+from typing import Dict, List
 import xml.etree.ElementTree as ElementTree
 
 from .wgc_api import WgcApi
 from .wgc_authserver import WgcAuthorizationServer
 from .wgc_application_local import WGCLocalApplication
-from .wgc_application_owned import WGCOwnedApplication, WGCOwnedApplicationInstance
-from .wgc_constants import FALLBACK_COUNTRY, FALLBACK_LANGUAGE, WGCInstallDocs
+from .wgc_application_owned import WGCOwnedApplication, WGCOwnedApplicationInstance, WGCOwnedApplicationRegistry
+from .wgc_constants import FALLBACK_COUNTRY, FALLBACK_LANGUAGE, WGCInstallDocs, WGCRealms
 from .wgc_error import MetadataNotFoundError
 from .wgc_gamerestrictions import WGCGameRestrictions
 from .wgc_helper import DETACHED_PROCESS
 from .wgc_http import WgcHttp
+from .wgc_httpcache import WgcHttpCache
 from .wgc_location import WGCLocation
 from .wgc_preferences import WgcPreferences
 from .wgc_wgni import WgcWgni
 from .wgc_xmpp import WgcXMPP
 
 class WGC():
-    def __init__(self):
-        self.__http = WgcHttp()
+    def __init__(self, http_cache_dir : str = None, http_host_override : str = None):
+        self.__http = WgcHttp(WgcHttpCache(http_cache_dir) if http_cache_dir else None, host_override = http_host_override)
         self.__wgni = WgcWgni(self.__http, self.get_tracking_id())
-        self.__authserver = WgcAuthorizationServer(self.__wgni)
+        self.__authserver = WgcAuthorizationServer(self.__wgni, self.get_likely_realms)
 
         preferences = WgcPreferences(WGCLocation.get_wgc_preferences_file())
         self.__api = WgcApi(self.__http, self.__wgni, preferences.get_country_code(), preferences.get_wgc_language())
+        self.__owned_applications = WGCOwnedApplicationRegistry()
+        self.__owned_applications_cache = None
+        self.__owned_applications_complete = False
 
 
     async def shutdown(self):
@@ -42,6 +46,16 @@ class WGC():
     def get_http_client(self) -> WgcHttp:
         return self.__http
 
+    def get_http_stats(self) -> Dict:
+        '''
+        returns latency histograms per endpoint, connection pool state and 202 poll counts
+        '''
+        return {
+            'latency': self.__http.get_latency_stats(),
+            'pool': self.__http.get_pool_stats(),
+            'polls': self.__http.get_poll_stats()
+        }
+
 
     #WGNI Client
     def get_wgni_client(self) -> WgcWgni:
@@ -70,6 +84,29 @@ class WGC():
         return tracking_id
 
 
+    # Realms
+
+    def get_likely_realms(self) -> List[str]:
+        '''
+        returns realms ordered by the chance to be used for login, realms of installed games go first
+        '''
+        realms = list()
+
+        for app_id in self.get_local_applications():
+            try:
+                realm = app_id.split('.')[1]
+            except Exception:
+                continue
+
+            if realm in WGCRealms and realm not in realms:
+                realms.append(realm)
+
+        for realm in WGCRealms:
+            if realm not in realms:
+                realms.append(realm)
+
+        return realms
+
     # Applications
 
     def get_local_applications(self) -> Dict[str, WGCLocalApplication]:
@@ -91,19 +128,44 @@ class WGC():
         return apps
 
     async def get_owned_applications(self, target_realm: str = None) -> Dict[str, WGCOwnedApplicationInstance]:
-        applications_instances = dict()
-        for application in await self.get_api_client().fetch_product_list():
-            for key, application_instance in application.get_application_instances().items():
-
-                #skip if realm is not match our target
-                realm = application_instance.get_application_realm()
-                if target_realm is not None:
-                    if realm != 'WW' and realm != 'CT' and realm != target_realm:
-                        continue
-                
-                applications_instances[key] = application_instance
-
-        return applications_instances
+        '''
+        returns owned applications, if the product list is incomplete previously known applications are kept
+        '''
+        product_list, is_complete = await self.get_api_client().fetch_product_list()
+        if is_complete:
+            self.__owned_applications_cache = self.get_api_client().dump_product_list(product_list)
+        self.__owned_applications_complete = is_complete
+        self.__owned_applications.update(product_list, is_complete)
+        return self.__owned_applications.get_instances(target_realm)
+
+    def is_owned_applications_complete(self) -> bool:
+        '''
+        returns False if the last fetched product list missed some products because of backend failures
+        '''
+        return self.__owned_applications_complete
+
+    def get_owned_application(self, app_id: str, target_realm: str) -> WGCOwnedApplicationInstance:
+        '''
+        returns instance available for the account realm from the last known catalog without network requests, None if it is unknown
+        '''
+        return self.__owned_applications.get_instance(app_id, target_realm)
+
+    def get_owned_applications_cache(self) -> Dict:
+        '''
+        returns compact form of the last complete product list to be stored between plugin runs
+        '''
+        return self.__owned_applications_cache
+
+    def load_owned_applications_cache(self, cache: Dict, target_realm: str = None) -> Dict[str, WGCOwnedApplicationInstance]:
+        '''
+        returns owned applications from the stored product list or None if it does not match current account
+        '''
+        product_list = self.get_api_client().load_product_list(cache)
+        if product_list is None:
+            return None
+
+        self.__owned_applications.update(product_list)
+        return self.__owned_applications.get_instances(target_realm)
 
     # WGC Client
 
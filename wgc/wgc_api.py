@@ -2,7 +2,6 @@
 # SPDX-License-Identifier: MIT
 
 from collections import namedtuple
-import json
 import logging
 import os
 import platform
@@ -11,13 +10,14 @@ import pprint
 import ssl
 import sys
 import threading
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 from urllib.parse import parse_qs
 
 import asyncio
 
 from .wgc_application_owned import WGCOwnedApplication
 from .wgc_constants import WGCAuthorizationResult, WGCRealms, GAMES_F2P
+from .wgc_error import BackendUnavailableError
 from .wgc_http import WgcHttp
 from .wgc_wgni import WgcWgni
 
@@ -30,6 +30,9 @@ class WgcApi:
 
     WGUS_METADATA = '/api/v1/metadata'
 
+    #amount of product URIs requested at once
+    WGCPS_PRODUCT_CONCURRENCY = 8
+
 
     def __init__(self, http : WgcHttp, wgni : WgcWgni, country_code : str = '', language_code : str = 'en'):
         self.__logger = logging.getLogger('wgc_api')
@@ -40,6 +43,9 @@ class WgcApi:
         self._country_code = country_code
         self._language_code = language_code
 
+        self.__product_list_key = None
+        self.__product_list_task = None
+
     async def shutdown(self):
         pass
 
@@ -47,12 +53,52 @@ class WgcApi:
     # Fetch product list
     #
 
-    async def fetch_product_list(self) -> List[WGCOwnedApplication]:
+    def get_product_list_key(self) -> str:
+        '''
+        returns key which identifies product list: account, realm, country and language
+        '''
+        return '%s:%s:%s:%s' % (self.__wgni.get_account_id(), self.__wgni.get_account_realm(), self._country_code, self._language_code)
+
+    def dump_product_list(self, product_list: List[WGCOwnedApplication]) -> Dict:
+        '''
+        returns compact JSON-serializable form of the product list together with its key
+        '''
+        return {'key': self.get_product_list_key(), 'products': [application.get_compact() for application in product_list]}
+
+    def load_product_list(self, dump: Dict) -> List[WGCOwnedApplication]:
+        '''
+        restores product list from dump_product_list() output, returns None if it belongs to another account or locale
+        '''
+        if not dump or dump.get('key') != self.get_product_list_key():
+            return None
+
+        try:
+            return [WGCOwnedApplication.from_compact(compact, self) for compact in dump['products']]
+        except Exception:
+            self.__logger.exception('load_product_list: failed to restore product list')
+            return None
+
+    async def fetch_product_list(self) -> Tuple[List[WGCOwnedApplication], bool]:
+        '''
+        returns product list and flag which is False if some purchased products may be missing because of backend failures
+        '''
+        #concurrent callers share one build of the product list
+        product_list_key = self.get_product_list_key()
+        if self.__product_list_task is None or self.__product_list_task.done() or self.__product_list_key != product_list_key:
+            self.__product_list_key = product_list_key
+            self.__product_list_task = asyncio.ensure_future(self.__fetch_product_list())
+
+        product_list, is_complete = await asyncio.shield(self.__product_list_task)
+        return list(product_list), is_complete
+
+    async def __fetch_product_list(self) -> Tuple[List[WGCOwnedApplication], bool]:
         product_list = list()
 
+        #products which failed to load are indistinguishable from not purchased ones
         additional_gameurls = list()
         purchased_gameids = list()
         wgcps_product_list = await self.__wgcps_fetch_product_list()
+        is_complete = wgcps_product_list is not None and not wgcps_product_list['data']['product_errors']
         if wgcps_product_list is not None:
             for game_data in wgcps_product_list['data']['product_content']:
                 wgc_data = game_data['metadata']['wgc']
@@ -61,13 +107,13 @@ class WgcApi:
 
         showroom_data = await self.__wguscs_get_showroom(additional_gameurls)
         if showroom_data is None:
-            self.__logger.error('fetch_product_list: error on retrieving showroom data')
-            return product_list
+            self.__logger.error('__fetch_product_list: error on retrieving showroom data')
+            return product_list, False
 
         for product in showroom_data['data']['showcase']:
             #check that instances are exists
             if not product['instances']:
-                self.__logger.warn('fetch_product_list: product has no instances %s' % product)
+                self.__logger.warn('__fetch_product_list: product has no instances %s' % product)
                 continue
 
             #prase game id
@@ -75,56 +121,91 @@ class WgcApi:
             try:
                 app_gameid = product['instances'][0]['application_id'].split('.')[0]
             except:
-                self.__logger.exception('fetch_product_list: failed to get app_id')
+                self.__logger.exception('__fetch_product_list: failed to get app_id')
 
             if app_gameid in GAMES_F2P or app_gameid in purchased_gameids:
                 is_purchased = app_gameid in purchased_gameids and app_gameid not in GAMES_F2P
-                product_list.append(WGCOwnedApplication(product, is_purchased, self))
+                product_list.append(WGCOwnedApplication.from_showroom(product, is_purchased, self))
             else:
-                self.__logger.warning('fetch_product_list: unknown ID %s' % app_gameid)
+                self.__logger.warning('__fetch_product_list: unknown ID %s' % app_gameid)
 
-        return product_list
+        if not is_complete:
+            self.__logger.warning('__fetch_product_list: product list is incomplete, purchased products may be missing')
+
+        return product_list, is_complete
 
     async def __wgcps_fetch_product_list(self):
         response = await self.__http.request_post_simple(
             'wgcps', self.__wgni.get_account_realm(), self.WGCPS_FETCH_PRODUCT_INFO, 
-            json = { 'account_id' : self.__wgni.get_account_id(), 'country' : self._country_code, 'storefront' : 'wgc_showcase' })
-
-        if response.status == 502:
-            self.__logger.warning('__wgcps_fetch_product_list: failed to get data: bad gateway')
-            return None
+            json = { 'account_id' : self.__wgni.get_account_id(), 'country' : self._country_code, 'storefront' : 'wgc_showcase' },
+            endpoint = 'wgcps.fetchProductList', retry = True)
 
-        if response.status == 504:
-            self.__logger.warning('__wgcps_fetch_product_list: failed to get data: gateway timeout')
-            return None
+        #transient errors are already retried by WgcHttp, reporting them as an empty library would drop the owned games
+        if response.status in (502, 503, 504):
+            self.__logger.warning('__wgcps_fetch_product_list: failed to get data: status %s' % response.status)
+            raise BackendUnavailableError()
 
         response_content = None
         try:
-            response_content = json.loads(response.text)
+            response_content = response.json()
         except Exception:
             self.__logger.exception('__wgcps_fetch_product_list: failed for parse json: %s' % response.text)
             return None
 
         if response.status != 200:
             #{"status": "error", "errors": [{"code": "platform_error", "context": {"result_code": "EXCEPTION"}}, {"code": "retry", "context": {"interval": 30}}]}
-            if 'errors' in response_content and response_content['errors'][0]['code'] == 'platform_error':
+            if 'errors' in response_content and any(error['code'] == 'retry' for error in response_content['errors']):
+                self.__logger.warning('__wgcps_fetch_product_list: service asks to retry later: %s' % response.text)
+                raise BackendUnavailableError()
+            elif 'errors' in response_content and response_content['errors'][0]['code'] == 'platform_error':
                 self.__logger.warning('__wgcps_fetch_product_list: platform error: %s' % response.text)
             else:
                 self.__logger.error('__wgcps_fetch_product_list: error on retrieving account info: %s' % response.text)
             return None
 
-        #load additional adata
+        #parsed body is shared with other callers of the same response, so it is copied before adding product data
+        response_content = dict(response_content, data = dict(response_content['data']))
+
+        #load additional adata, products are requested concurrently but kept in the original order
+        product_uris = response_content['data']['product_uris']
+        semaphore = asyncio.Semaphore(self.WGCPS_PRODUCT_CONCURRENCY)
+        product_results = await asyncio.gather(*[self.__wgcps_fetch_product(product_uri, semaphore) for product_uri in product_uris])
+
         response_content['data']['product_content'] = list()
-        for product_uri in response_content['data']['product_uris']:
-            product_response = await self.__http.request_get(product_uri)
-            if product_response.status != 200:
-                self.__logger.error('__wgcps_fetch_product_list: error on retrieving product info: %s' % product_uri)
+        response_content['data']['product_errors'] = dict()
+        for product_uri, (product_content, product_error) in zip(product_uris, product_results):
+            if product_error is not None:
+                response_content['data']['product_errors'][product_uri] = product_error
                 continue
 
-            response_content['data']['product_content'].append(json.loads(product_response.text))
+            response_content['data']['product_content'].append(product_content)
+
+        if response_content['data']['product_errors']:
+            self.__logger.error('__wgcps_fetch_product_list: failed to retrieve %s of %s products' % (len(response_content['data']['product_errors']), len(product_uris)))
 
         return response_content
 
+    async def __wgcps_fetch_product(self, product_uri: str, semaphore: asyncio.Semaphore):
+        '''
+        returns tuple of product content and error description
+        '''
+        async with semaphore:
+            try:
+                product_response = await self.__http.request_get(product_uri, realm = self.__wgni.get_account_realm(), endpoint = 'wgcps.product', cache = True)
+            except Exception as e:
+                self.__logger.exception('__wgcps_fetch_product: failed to request product info: %s' % product_uri)
+                return (None, 'request failed: %s' % repr(e))
+
+        if product_response.status != 200:
+            self.__logger.error('__wgcps_fetch_product: error on retrieving product info: %s, %s, %s' % (product_uri, product_response.status, product_response.text))
+            return (None, 'status %s' % product_response.status)
+
+        try:
+            return (product_response.json(), None)
+        except Exception:
+            self.__logger.exception('__wgcps_fetch_product: failed to parse product info: %s, %s' % (product_uri, product_response.text))
+            return (None, 'invalid json')
+
     async def __wguscs_get_showroom(self, additional_urls : List[str] = None):
         additionals = ''
         if additional_urls:     
@@ -136,13 +217,17 @@ class WgcApi:
         url = url + '&country_code=%s' % self._country_code
         url = url + additionals
 
-        showroom_response = await self.__http.request_get(url)
-        
+        showroom_response = await self.__http.request_get(url, realm = self.__wgni.get_account_realm(), endpoint = 'wguscs.showroom', cache = True)
+
+        if showroom_response.status in (502, 503, 504):
+            self.__logger.warning('__wguscs_get_showroom: failed to get data: status %s' % showroom_response.status)
+            raise BackendUnavailableError()
+
         if showroom_response.status != 200:
             self.__logger.error('__wguscs_get_showroom: error on retrieving showroom data: %s' % showroom_response.text)
             return None
 
-        return json.loads(showroom_response.text)
+        return showroom_response.json()
 
     #
     # Metadata download
@@ -151,7 +236,7 @@ class WgcApi:
     async def fetch_app_metadata(self, update_server: str, app_id: str) -> str:
         url = '%s/%s/?guid=%s&chain_id=unknown&protocol_version=6.4' % (update_server, self.WGUS_METADATA, app_id)
         
-        response = await self.__http.request_get(url) 
+        response = await self.__http.request_get(url, realm = self.__wgni.get_account_realm(), endpoint = 'wgus.metadata', cache = True)
         if response.status != 200:
             self.__logger.error('fetch_app_metadata: error on retrieving showroom data: (%s, %s)' % (url, response.text))
             return None
@@ -2,12 +2,13 @@
 # SPDX-License-Identifier: MIT
 
 import codecs
+import hashlib
 import logging
 import os
 import random
 import string
 import subprocess
-from typing import Dict
+from typing import Dict, List, Tuple
 
 
 from .wgc_apptype import WgcAppType
@@ -19,31 +20,44 @@ from .wgc_metadata import WgcMetadata
 from .wgc_preferences import WgcPreferences
 
 class WGCOwnedApplicationInstance():
-    def __init__(self, app_data, instance_data, is_purchased, api):
+    '''
+    Owned application instance, fields derived from application id and name are computed once
+    '''
+
+    __slots__ = ('__logger', '__id', '__gameid', '__realm', '__name', '__fullname', '__update_url', '__is_purchased', '__api', '__content_hash')
+
+    def __init__(self, app_id: str, name: str, update_url: str, is_purchased: bool, api):
         self.__logger = logging.getLogger('wgc_application_owned_instance')
 
-        self._name = app_data['game_name']
-        self._data = instance_data
+        #<gameid>.<realm>.<branch>, e.g. WOT.RU.PRODUCTION
+        self.__id = app_id
+        self.__gameid, self.__realm = app_id.split('.')[:2]
+
+        self.__name = fixup_gamename(name)
+        if self.__realm == 'WW':
+            self.__fullname = self.__name
+        else:
+            self.__fullname = '%s (%s)' % (self.__name, self.__realm)
+
+        self.__update_url = update_url
         self.__is_purchased = is_purchased
         self.__api = api
+        self.__content_hash = None
 
     def get_application_id(self):
-        return self._data['application_id']
+        return self.__id
 
     def get_application_gameid(self):
-        return self.get_application_id().split('.')[0]
+        return self.__gameid
 
     def get_application_realm(self):
-        return self.get_application_id().split('.')[1]
+        return self.__realm
 
     def get_application_name(self):
-        return fixup_gamename(self._name)
+        return self.__name
 
     def get_application_fullname(self):
-        if self.get_application_realm() == 'WW':
-            return self.get_application_name()
-        else:
-            return '%s (%s)' % (self.get_application_name(), self.get_application_realm())
+        return self.__fullname
 
     def get_application_install_url(self):
         return '%s@%s' % (self.get_application_id(), self.get_update_service_url())
@@ -55,11 +69,20 @@ class WGCOwnedApplicationInstance():
         return await self.__api.fetch_app_metadata(self.get_update_service_url(), self.get_application_id())
 
     def get_update_service_url(self):
-        return self._data['update_service_url']
+        return self.__update_url
 
     def is_application_purchased(self) -> bool:
         return self.__is_purchased
 
+    def get_content_hash(self) -> str:
+        '''
+        returns hash of the fields exposed to GLX client, changes when the instance has to be updated
+        '''
+        if self.__content_hash is None:
+            content = '\n'.join([self.__id, self.__fullname, str(self.__is_purchased), self.__update_url])
+            self.__content_hash = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        return self.__content_hash
+
     async def install_application(self) -> bool:
         if not WGCLocation.is_wgc_installed():
             self.__logger.warning('install_application: failed to install %s because WGC is not installed' % self.get_application_id())
@@ -115,22 +138,120 @@ class WGCOwnedApplicationInstance():
 
 
 class WGCOwnedApplication():
+    '''
+    Owned application with its instances, the showroom product is not referenced after parsing
+    '''
 
-    def __init__(self, data, is_purchased, api):
-        self.__data = data
+    __slots__ = ('__name', '__is_purchased', '_instances')
+
+    @staticmethod
+    def from_showroom(product: Dict, is_purchased: bool, api) -> 'WGCOwnedApplication':
+        '''
+        projects showroom product onto the fields used by the plugin
+        '''
+        instances = [(instance['application_id'], instance['update_service_url']) for instance in product['instances']]
+        return WGCOwnedApplication(product['game_name'], instances, is_purchased, api)
+
+    @staticmethod
+    def from_compact(compact, api) -> 'WGCOwnedApplication':
+        '''
+        restores application from the output of get_compact()
+        '''
+        name, is_purchased, instances = compact
+        return WGCOwnedApplication(name, instances, is_purchased, api)
+
+    def __init__(self, name: str, instances: List[Tuple[str, str]], is_purchased: bool, api):
+        '''
+        instances are pairs of application id and update service URL
+        '''
+        self.__name = fixup_gamename(name)
         self.__is_purchased = is_purchased
-        self.__api = api
 
         self._instances = dict()
-        for instance_json in self.__data['instances']:
-            instance_obj = WGCOwnedApplicationInstance(self.__data, instance_json, is_purchased, self.__api)
-            self._instances[instance_obj.get_application_id()] = instance_obj
+        for app_id, update_url in instances:
+            self._instances[app_id] = WGCOwnedApplicationInstance(app_id, self.__name, update_url, is_purchased, api)
 
     def is_application_purchased(self) -> bool:
         return self.__is_purchased
 
     def get_application_name(self) -> str:
-        return fixup_gamename(self.__data['game_name'])
+        return self.__name
 
     def get_application_instances(self) -> Dict[str, WGCOwnedApplicationInstance]:
         return self._instances
+
+    def get_compact(self) -> List:
+        '''
+        returns JSON-serializable form with only the fields used by the plugin
+        '''
+        return [self.__name, self.__is_purchased, [[instance.get_application_id(), instance.get_update_service_url()] for instance in self._instances.values()]]
+
+
+class WGCOwnedApplicationRegistry():
+    '''
+    Owned application instances indexed by application id and realm
+    '''
+
+    #instances of these realms are available for every account realm
+    REALMS_GLOBAL = ['WW', 'CT']
+
+    def __init__(self):
+        self.__by_id = dict()
+        self.__by_realm = dict()
+
+    def update(self, product_list: List[WGCOwnedApplication], is_complete: bool = True) -> None:
+        '''
+        replaces content with the given product list, instances with unchanged content are kept as is,
+        instances missing from incomplete product list are kept too
+        '''
+        instances = dict()
+        for application in product_list:
+            instances.update(application.get_application_instances())
+
+        if is_complete:
+            for app_id in self.__by_id.keys() - instances.keys():
+                self.__remove(app_id)
+
+        for app_id, instance in instances.items():
+            known_instance = self.__by_id.get(app_id)
+            if known_instance is not None and known_instance.get_content_hash() == instance.get_content_hash():
+                continue
+
+            self.__remove(app_id)
+            self.__add(instance)
+
+    def get_instance(self, app_id: str, target_realm: str) -> WGCOwnedApplicationInstance:
+        '''
+        returns instance if it is available for the account realm, None otherwise
+        '''
+        instance = self.__by_id.get(app_id)
+        if instance is None or instance.get_application_realm() not in self.REALMS_GLOBAL + [target_realm]:
+            return None
+        return instance
+
+    def get_instances(self, target_realm: str = None) -> Dict[str, WGCOwnedApplicationInstance]:
+        '''
+        returns instances available for the account realm, all instances if the realm is not given
+        '''
+        if target_realm is None:
+            return dict(self.__by_id)
+
+        result = dict()
+        for realm in self.REALMS_GLOBAL + [target_realm]:
+            result.update(self.__by_realm.get(realm, {}))
+        return result
+
+    def __add(self, instance: WGCOwnedApplicationInstance) -> None:
+        app_id = instance.get_application_id()
+        self.__by_id[app_id] = instance
+        self.__by_realm.setdefault(instance.get_application_realm(), dict())[app_id] = instance
+
+    def __remove(self, app_id: str) -> None:
+        instance = self.__by_id.pop(app_id, None)
+        if instance is None:
+            return
+
+        realm = instance.get_application_realm()
+        self.__by_realm[realm].pop(app_id)
+        if not self.__by_realm[realm]:
+            self.__by_realm.pop(realm)
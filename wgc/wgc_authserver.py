@@ -11,10 +11,15 @@ class WgcAuthorizationServer():
     LOCALSERVER_HOST = '127.0.0.1'
     LOCALSERVER_PORT = 13337
 
-    def __init__(self, backend):
+    def __init__(self, backend, likely_realms = None):
+        '''
+        likely_realms is a function which returns realms ordered by the chance to be used for login, it is called once on start
+        '''
         self.__logger = logging.getLogger('wgc_authserver')
 
         self.__backend = backend
+        self.__likely_realms = likely_realms
+        self.__realms = None
         self.__app = aiohttp.web.Application()
 
         self.__runner = None
@@ -29,6 +34,7 @@ class WgcAuthorizationServer():
             aiohttp.web.get ('/2fa_failed'           , self.handle_2fa_failed_get               ),
             aiohttp.web.get ('/finished'             , self.handle_finished_get                 ),
             aiohttp.web.get ('/unsupported_platform' , self.handle_unsupported_platform_get     ),
+            aiohttp.web.get ('/login_progress'       , self.handle_login_progress_get           ),
             
             aiohttp.web.post('/login'   , self.handle_login_post  ),   
             aiohttp.web.post('/2fa'     , self.handle_2fa_post    ),
@@ -51,6 +57,13 @@ class WgcAuthorizationServer():
             self.__logger.warning('auth_server_start: auth server object is already exists')
             return False
 
+        #likely realms are found by scanning installed games, so it is done once and outside of the event loop
+        if self.__likely_realms is not None:
+            try:
+                self.__realms = await asyncio.get_event_loop().run_in_executor(None, self.__likely_realms)
+            except Exception:
+                self.__logger.exception('start: failed to get likely realms')
+
         self.__task = asyncio.create_task(self.__worker(self.LOCALSERVER_HOST, self.LOCALSERVER_PORT))
         return True
 
@@ -72,12 +85,14 @@ class WgcAuthorizationServer():
     #
 
     async def handle_login_get(self, request):
+        self.__prefetch_challenges()
         return aiohttp.web.FileResponse(os.path.join(os.path.dirname(os.path.realpath(__file__)),'html/login.html'))
 
     async def handle_unsupported_platform_get(self, request):
         return aiohttp.web.FileResponse(os.path.join(os.path.dirname(os.path.realpath(__file__)),'html/unsupported_platform.html'))
 
     async def handle_login_failed_get(self, request):
+        self.__prefetch_challenges()
         return aiohttp.web.FileResponse(os.path.join(os.path.dirname(os.path.realpath(__file__)),'html/login_failed.html'))
 
     async def handle_2fa_get(self, request):
@@ -89,7 +104,13 @@ class WgcAuthorizationServer():
     async def handle_finished_get(self, request):
         return aiohttp.web.FileResponse(os.path.join(os.path.dirname(os.path.realpath(__file__)),'html/finished.html'))
 
+    async def handle_login_progress_get(self, request):
+        return aiohttp.web.json_response(self.__backend.get_pow_progress())
+
     async def handle_login_post(self, request):
+        #new submission makes the previous one stale
+        self.__backend.cancel_pow()
+
         data = await request.post()
         auth_result = WGCAuthorizationResult.FAILED
 
@@ -120,6 +141,18 @@ class WgcAuthorizationServer():
 
         self.__process_auth_result(auth_result)
 
+    def __prefetch_challenges(self):
+        '''
+        solves challenges in background while the user is typing credentials
+        '''
+        if not self.__realms:
+            return
+
+        try:
+            self.__backend.prefetch_challenges(self.__realms)
+        except Exception:
+            self.__logger.exception('__prefetch_challenges: failed to start prefetch')
+
     def __process_auth_result(self, auth_result):
         if auth_result == WGCAuthorizationResult.FINISHED:
             raise aiohttp.web.HTTPFound('/finished')
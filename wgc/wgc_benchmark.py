@@ -0,0 +1,124 @@
+# (c) 2019-2020 Mikhail Paulyshka
+# SPDX-License-Identifier: MIT
+
+'''
+Keccak512 and proof-of-work benchmark, prints results as JSON
+
+Usage: python -m wgc.wgc_benchmark [--duration SECONDS] [--output FILE]
+'''
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict
+
+from .wgc_keccak import Keccak512Backends, Keccak512Batch, get_backend
+from .wgc_pow import POW_STRATEGY_EXECUTOR, POW_STRATEGY_MULTIPROCESS, hashcash_calibrate, hashcash_estimate, \
+    hashcash_search_batch, hashcash_search_flat, hashcash_search_hash, hashcash_select_strategy
+
+BENCHMARK_DURATION = 2.0
+
+BENCHMARK_COMPLEXITIES = range(1, 7)
+
+#typical hashcash string with nonce
+BENCHMARK_MESSAGE = b'1:4:1590000000:wgni::0123456789abcdef0123456789abcdef:'
+
+
+def benchmark_keccak(backend: str, duration: float = BENCHMARK_DURATION) -> float:
+    '''
+    returns amount of Keccak512 hashes per second computed by the given backend
+    '''
+    factory = Keccak512Backends[backend]
+
+    hashes = 0
+    time_start = time.perf_counter()
+    time_end = time_start + duration
+
+    while True:
+        keccak_hash = factory(BENCHMARK_MESSAGE + str(hashes).encode('utf-8'))
+        keccak_hash.hexdigest()
+        hashes += 1
+
+        time_now = time.perf_counter()
+        if time_now >= time_end:
+            return hashes / (time_now - time_start)
+
+
+def benchmark_hashcash(search: Callable, duration: float = BENCHMARK_DURATION) -> float:
+    '''
+    returns amount of nonces per second scanned by the given hashcash search function
+    '''
+    nonces = 0
+    block_size = 64
+    time_start = time.perf_counter()
+    time_end = time_start + duration
+
+    while True:
+        #complexity 64 is never satisfied, so the whole block is scanned
+        search(BENCHMARK_MESSAGE, 64, nonces, nonces + block_size)
+        nonces += block_size
+        block_size = min(block_size * 2, 4096)
+
+        time_now = time.perf_counter()
+        if time_now >= time_end:
+            return nonces / (time_now - time_start)
+
+
+def run_benchmark(duration: float = BENCHMARK_DURATION) -> Dict:
+    '''
+    runs all benchmarks and returns JSON-serializable results
+    '''
+    result = dict()
+
+    result['environment'] = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+    #backends are checked against known answers on registration
+    result['keccak'] = {
+        'active': get_backend(),
+        'hashes_per_second': {backend: benchmark_keccak(backend, duration) for backend in Keccak512Backends}
+    }
+
+    searches = {'hash': hashcash_search_hash, 'flat': hashcash_search_flat}
+    if Keccak512Batch.is_available():
+        searches['batch'] = hashcash_search_batch
+    result['hashcash'] = {'nonces_per_second': {name: benchmark_hashcash(search, duration) for name, search in searches.items()}}
+
+    calibration = hashcash_calibrate()
+    result['calibration'] = calibration
+
+    result['complexity'] = dict()
+    for complexity in BENCHMARK_COMPLEXITIES:
+        result['complexity'][complexity] = {
+            'strategy': hashcash_select_strategy(complexity, calibration),
+            POW_STRATEGY_EXECUTOR: hashcash_estimate(complexity, calibration, POW_STRATEGY_EXECUTOR),
+            POW_STRATEGY_MULTIPROCESS: hashcash_estimate(complexity, calibration, POW_STRATEGY_MULTIPROCESS)
+        }
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Keccak512 and proof-of-work benchmark')
+    parser.add_argument('--duration', type = float, default = BENCHMARK_DURATION, help = 'duration of every measurement in seconds')
+    parser.add_argument('--output', help = 'file to write JSON results to instead of stdout')
+    args = parser.parse_args()
+
+    result = run_benchmark(args.duration)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent = 4)
+    else:
+        json.dump(result, sys.stdout, indent = 4)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
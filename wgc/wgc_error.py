@@ -2,4 +2,10 @@
 # SPDX-License-Identifier: MIT
 
 class MetadataNotFoundError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class BackendUnavailableError(Exception):
+    '''
+    Wargaming backend is temporarily unable to serve the request
+    '''
+    pass
@@ -1,38 +1,158 @@
 # (c) 2019-2020 Mikhail Paulyshka
 # SPDX-License-Identifier: MIT
 
-import collections
+import asyncio
+import email.utils
+import json
 import logging
+import random
 import ssl
+import time
+from types import MappingProxyType, SimpleNamespace
 from typing import Any, Dict
+from urllib.parse import urlsplit
 
 import aiohttp
 import certifi
 
 from .wgc_constants import WGCRealms
+from .wgc_httpcache import WgcHttpCache
+from .wgc_httpstats import WgcHttpLatencyStats, WgcHttpPoolStats
+
+class WgcHttpResponse:
+    '''
+    HTTP response with raw body, text and JSON are decoded on first access
+    '''
+
+    __slots__ = ('status', 'headers', 'body', '_text', '_json')
+
+    def __init__(self, status: int, headers: Any, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+        self._text = None
+        self._json = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.body.decode('utf-8', errors = 'replace')
+        return self._text
+
+    def json(self) -> Any:
+        '''
+        returns body decoded from JSON, the object is decoded once and shared between calls and between callers
+        of coalesced requests, so it must be treated as read-only and copied before modification
+        '''
+        if self._json is None:
+            self._json = json.loads(self.body)
+        return self._json
+
 
 class WgcHttp:
     HTTP_USER_AGENT = 'wgc/20.01.00.9514'
-    
-    def __init__(self):
+
+    #polling of 202 Accepted responses: delay before the first poll, backoff multiplier, delay cap and overall deadline, in seconds
+    POLL_INITIAL_DELAY = 0.5
+    POLL_BACKOFF = 2.0
+    POLL_MAX_DELAY = 8.0
+    POLL_DEADLINE = 60.0
+
+    #retries of transient failures: attempts per request, backoff base, jitter fraction and the longest acceptable wait, in seconds
+    RETRY_ATTEMPTS = 3
+    RETRY_BASE_DELAY = 1.0
+    RETRY_JITTER = 0.5
+    RETRY_MAX_DELAY = 30.0
+    RETRY_STATUSES = (502, 503, 504)
+    RETRY_METHODS = ('GET', 'HEAD')
+
+    #overall time in seconds for all attempts of a request together with their 202 polling and waits between them
+    REQUEST_DEADLINE = 90.0
+
+    #circuit breaker: consecutive failed requests after which the host is skipped for given amount of seconds,
+    #after that a single probe request decides whether the circuit is closed or opened again
+    CIRCUIT_THRESHOLD = 5
+    CIRCUIT_OPEN_SECONDS = 60.0
+
+    #delay in seconds before changes of the cache index are written, so many responses share one write
+    CACHE_FLUSH_DELAY = 5.0
+
+    #connection pool: total and per-host connection limits, DNS cache TTL and idle connection lifetime, in seconds
+    CONNECTION_LIMIT = 32
+    CONNECTION_LIMIT_PER_HOST = 8
+    DNS_CACHE_TTL = 600
+    KEEPALIVE_TIMEOUT = 60.0
+
+    def __init__(self, cache : WgcHttpCache = None, *, poll_initial_delay: float = POLL_INITIAL_DELAY, poll_backoff: float = POLL_BACKOFF,
+                 poll_max_delay: float = POLL_MAX_DELAY, poll_deadline: float = POLL_DEADLINE, request_deadline: float = REQUEST_DEADLINE,
+                 connection_limit: int = CONNECTION_LIMIT, connection_limit_per_host: int = CONNECTION_LIMIT_PER_HOST,
+                 dns_cache_ttl: int = DNS_CACHE_TTL, keepalive_timeout: float = KEEPALIVE_TIMEOUT, host_override: str = None):
+        '''
+        host_override is scheme and host (e.g. http://127.0.0.1:13338) which replaces backend hosts of every realm
+        '''
         self.__logger = logging.getLogger('wgc_http')
 
+        self.__host_override = host_override
+
+        self.__cache = cache
+        self.__cache_flush_task = None
+        self.__inflight = dict()
+
+        self.__poll_initial_delay = poll_initial_delay
+        self.__poll_backoff = poll_backoff
+        self.__poll_max_delay = poll_max_delay
+        self.__poll_deadline = poll_deadline
+        self.__poll_stats = dict()
+
+        self.__request_deadline = request_deadline
+        self.__hosts = dict()
+
         self.__sslcontext = ssl.create_default_context(cafile=certifi.where())
-        self.__connector = aiohttp.TCPConnector(ssl_context=self.__sslcontext)
-        self.__session_headers = {'User-Agent': self.HTTP_USER_AGENT}
-        self.__session = aiohttp.ClientSession(connector=self.__connector, headers = self.__session_headers)
+        self.__connector = aiohttp.TCPConnector(ssl_context=self.__sslcontext, limit = connection_limit, limit_per_host = connection_limit_per_host,
+                                                ttl_dns_cache = dns_cache_ttl, keepalive_timeout = keepalive_timeout)
+        self.__pool_stats = WgcHttpPoolStats()
+        self.__latency_stats = WgcHttpLatencyStats()
+
+        #base headers are never changed, everything request-specific is passed as an overlay
+        self.__base_headers = MappingProxyType({'User-Agent': self.HTTP_USER_AGENT})
+        self.__realm_headers = dict()
+        self.__session = aiohttp.ClientSession(connector=self.__connector, headers = dict(self.__base_headers),
+                                               trace_configs = [self.__pool_stats.get_trace_config(), self.__latency_stats.get_trace_config()])
 
 
     async def shutdown(self):
+        if self.__cache_flush_task is not None:
+            self.__cache_flush_task.cancel()
+        await self.__flush_cache()
+
         await self.__session.close()
 
 
+    def get_pool_stats(self) -> Dict:
+        '''
+        returns open, idle and acquired connections, reuse ratio and TLS handshakes per host
+        '''
+        return self.__pool_stats.get_stats(self.__connector)
+
+
+    def get_latency_stats(self) -> Dict:
+        '''
+        returns DNS, connect, time-to-first-byte and body read histograms per logical endpoint
+        '''
+        return self.__latency_stats.get_stats()
+
+
     #
     # URL Formatting
     # 
     def get_url(self, ltype : str, realm: str, url: str) -> str:
         realm = realm.upper()
-        
+
+        #all backends are served by the stand-in, paths do not overlap
+        if self.__host_override is not None:
+            return '%s%s' % (self.__host_override, url)
+
         try:
             return 'https://%s%s' % (WGCRealms[realm]['domain_%s' % ltype ], url)
         except Exception:
@@ -40,46 +160,375 @@ class WgcHttp:
             return None
 
 
-    def update_headers(self, headers: Dict):
+    #
+    # Headers
+    #
+
+    def set_authorization(self, realm: str, authorization: str) -> None:
         '''
-        update HTTP headers
+        sets Authorization header sent with requests made on behalf of the realm, None removes it
         '''
-        self.__session_headers.update(headers)
+        realm = realm.upper()
+        if authorization is None:
+            self.__realm_headers.pop(realm, None)
+            return
 
+        #overlay is replaced instead of being changed in place, so requests in flight keep their headers
+        self.__realm_headers[realm] = MappingProxyType({'Authorization': authorization})
+
+
+    def get_headers(self, realm: str = None, headers: Dict[str, str] = None) -> Dict[str, str]:
+        '''
+        returns headers of the request: base headers, then realm headers, then request-specific ones
+        '''
+        request_headers = dict(self.__base_headers)
+        if realm is not None:
+            request_headers.update(self.__realm_headers.get(realm.upper(), {}))
+        if headers:
+            request_headers.update(headers)
+        return request_headers
+
+
+    #
+    # Requests
+    #
+
+    async def request(self, method: str, url: str, *, params: Any = None, data: Any = None, json: Any = None, realm: str = None, headers: Dict[str, str] = None,
+                      endpoint: str = None, retry: bool = None, cache: bool = False):
+        '''
+        endpoint is the logical name of the backend call used in latency statistics, host name is used if it is not given
+
+        cache enables disk cache for GET request without params, responses which may be used only once must not be cached
+
+        retry enables retries of transient failures, by default only idempotent methods are retried
+        because other requests may carry one-time credentials (e.g. OTP code or proof-of-work)
+        '''
+        if retry is None:
+            retry = method in self.RETRY_METHODS
+
+        request_headers = self.get_headers(realm, headers)
+        trace_context = SimpleNamespace(endpoint = endpoint or urlsplit(url).netloc)
+        if method != 'GET' or params is not None:
+            return await self.__request(method, url, request_headers, trace_context, retry, False, params = params, data = data, json = json)
+
+        #identical GET requests which are already in flight share one response
+        flight_key = (url, tuple(sorted(request_headers.items())), retry, cache)
+        flight = self.__inflight.get(flight_key)
+        if flight is None:
+            flight = asyncio.ensure_future(self.__request(method, url, request_headers, trace_context, retry, cache))
+            flight.add_done_callback(lambda _: self.__inflight.pop(flight_key, None))
+            self.__inflight[flight_key] = flight
+
+        return await asyncio.shield(flight)
+
+
+    async def __request(self, method: str, url: str, request_headers: Dict[str, str], trace_context: SimpleNamespace, retry: bool, cache: bool, *,
+                        params: Any = None, data: Any = None, json: Any = None):
+        #serve fresh response from cache or ask server to confirm the cached one
+        cache_key = None
+        cache_entry = None
+        if cache and self.__cache is not None and method == 'GET' and params is None:
+            cache_key = self.__cache.get_key(method, url, request_headers)
+            cache_entry = self.__cache.get(cache_key)
+            if cache_entry is not None:
+                if self.__cache.is_fresh(cache_entry):
+                    return WgcHttpResponse(200, dict(), await self.__run_in_executor(self.__cache.get_body, cache_key))
+                request_headers = dict(request_headers, **self.__cache.get_conditional_headers(cache_entry))
+
+        response_status, response_headers, response_body = await self.__send(method, url, request_headers, trace_context, retry, params = params, data = data, json = json)
+
+        if cache_key is not None:
+            if response_status == 304 and cache_entry is not None:
+                self.__cache.revalidated(cache_key)
+                self.__schedule_cache_flush()
+                return WgcHttpResponse(200, response_headers, await self.__run_in_executor(self.__cache.get_body, cache_key))
+
+            if response_status == 200 and self.__cache.is_cacheable(url, response_headers):
+                if await self.__run_in_executor(self.__cache.write_body, cache_key, response_body):
+                    evicted = self.__cache.add(cache_key, url, response_headers, len(response_body))
+                    if evicted:
+                        await self.__run_in_executor(self.__cache.remove_bodies, evicted)
+                    self.__schedule_cache_flush()
+
+        return WgcHttpResponse(response_status, response_headers, response_body)
+
+
+    #
+    # Cache files
+    #
+
+    async def __run_in_executor(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+
+    def __schedule_cache_flush(self) -> None:
+        '''
+        writes cache index after a delay, changes made in the meantime are written together
+        '''
+        if self.__cache_flush_task is None or self.__cache_flush_task.done():
+            self.__cache_flush_task = asyncio.ensure_future(self.__flush_cache(self.CACHE_FLUSH_DELAY))
+
+
+    async def __flush_cache(self, delay: float = 0.0) -> None:
+        if delay > 0.0:
+            await asyncio.sleep(delay)
+
+        if self.__cache is not None and self.__cache.is_dirty():
+            await self.__run_in_executor(self.__cache.write_index, self.__cache.dump_index())
+
+
+    async def __send(self, method: str, url: str, headers: Dict[str, str], trace_context: SimpleNamespace, retry: bool, *, params: Any = None, data: Any = None, json: Any = None):
+        '''
+        sends request with retries of transient failures if they are allowed, fails fast while the host circuit is open
+        '''
+        host = self.__get_host(url)
+        if host['open_until'] > time.monotonic():
+            self.__logger.warning('__send: circuit is open, request is skipped: %s' % url)
+            return 503, {'Retry-After': str(int(host['open_until'] - time.monotonic()) + 1)}, b''
+
+        #half-open circuit lets one probe request through, others are skipped until its result is known
+        is_probe = host['open_until'] > 0.0
+        if is_probe:
+            if host['probing']:
+                self.__logger.warning('__send: circuit is half-open and probe is in flight, request is skipped: %s' % url)
+                return 503, {'Retry-After': '1'}, b''
+            host['probing'] = True
+
+        attempts = self.RETRY_ATTEMPTS if retry and not is_probe else 1
+        attempt = 0
+        time_deadline = time.monotonic() + self.__request_deadline
+        try:
+            while True:
+                attempt += 1
+                try:
+                    response_status, response_headers, response_body = await asyncio.wait_for(
+                        self.__send_once(method, url, headers, trace_context, time_deadline, params = params, data = data, json = json),
+                        max(time_deadline - time.monotonic(), 0.0))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    retry_delay = self.__get_retry_delay(attempt, None)
+                    if attempt >= attempts or time.monotonic() + retry_delay > time_deadline:
+                        self.__add_host_failure(url)
+                        raise
+                    self.__logger.warning('__send: attempt %s failed for %s: %s' % (attempt, url, repr(e)))
+                    await asyncio.sleep(retry_delay)
+                    continue
+
+                retry_interval = self.__get_retry_interval(response_status, response_headers, response_body)
+                if response_status not in self.RETRY_STATUSES and retry_interval is None:
+                    self.__add_host_success(url)
+                    return response_status, response_headers, response_body
+
+                retry_delay = self.__get_retry_delay(attempt, retry_interval)
+                if attempt >= attempts or (retry_interval is not None and retry_interval > self.RETRY_MAX_DELAY) or time.monotonic() + retry_delay > time_deadline:
+                    self.__logger.warning('__send: giving up after %s attempts for %s, status %s' % (attempt, url, response_status))
+                    self.__add_host_failure(url)
+                    return response_status, response_headers, response_body
+
+                self.__logger.info('__send: attempt %s failed for %s with status %s, retrying' % (attempt, url, response_status))
+                await asyncio.sleep(retry_delay)
+        finally:
+            #cancelled probe leaves the circuit half-open, so the next request probes again
+            if is_probe:
+                host['probing'] = False
+
+
+    async def __send_once(self, method: str, url: str, headers: Dict[str, str], trace_context: SimpleNamespace, time_deadline: float, *,
+                          params: Any = None, data: Any = None, json: Any = None):
+        '''
+        sends request once and follows 202 Accepted responses until the request deadline, returns status, headers and body of the final response
+        '''
+        async with self.__session.request(method, url, headers = headers, params = params, data = data, json = json, trace_request_ctx = trace_context) as response:
+            response_body = await response.read()
+            response_status = response.status
+            response_headers = response.headers
+            response_url = str(response.url)
+
+        if response_status == 202 and 'Location' in response_headers:
+            response_status, response_headers, response_body = await self.__poll(method, url, headers, trace_context, time_deadline, response_url, response_headers, response_body)
+
+        return response_status, response_headers, response_body
+
+
+    def __get_retry_interval(self, status: int, headers: Any, body: bytes) -> float:
+        '''
+        returns retry interval requested by the server via WGCPS retry error or Retry-After header, or None
+        '''
+        if status == 200:
+            return None
+
+        #{"status": "error", "errors": [{"code": "platform_error", ...}, {"code": "retry", "context": {"interval": 30}}]}
+        try:
+            for error in json.loads(body)['errors']:
+                if error['code'] == 'retry':
+                    return float(error['context']['interval'])
+        except Exception:
+            pass
+
+        if status in self.RETRY_STATUSES:
+            return self.__get_retry_after(headers)
+
+        return None
+
+
+    def __get_retry_delay(self, attempt: int, retry_interval: float) -> float:
+        '''
+        returns jittered delay before the next attempt, never shorter than the interval requested by the server
+        '''
+        delay = self.RETRY_BASE_DELAY * 2 ** (attempt - 1)
+        if retry_interval is not None:
+            delay = retry_interval
+
+        return min(delay * random.uniform(1.0, 1.0 + self.RETRY_JITTER), self.RETRY_MAX_DELAY)
+
+
+    #
+    # Circuit breaker
+    #
+
+    def __get_host(self, url: str) -> Dict:
+        '''
+        returns circuit state of the host, open_until is zero while the circuit is closed
+        '''
+        hostname = urlsplit(url).netloc
+        host = self.__hosts.get(hostname)
+        if host is None:
+            host = {'failures': 0, 'open_until': 0.0, 'probing': False}
+            self.__hosts[hostname] = host
+        return host
+
+
+    def __add_host_success(self, url: str) -> None:
+        host = self.__get_host(url)
+        if host['open_until'] > 0.0:
+            self.__logger.info('__add_host_success: circuit is closed for %s' % urlsplit(url).netloc)
+
+        host['failures'] = 0
+        host['open_until'] = 0.0
+
+
+    def __add_host_failure(self, url: str) -> None:
+        host = self.__get_host(url)
+        host['failures'] += 1
+
+        #failed probe of the half-open circuit opens it again, failures are not reset until a request succeeds
+        if host['failures'] >= self.CIRCUIT_THRESHOLD:
+            host['open_until'] = time.monotonic() + self.CIRCUIT_OPEN_SECONDS
+            self.__logger.warning('__add_host_failure: circuit is opened for %s seconds for %s' % (self.CIRCUIT_OPEN_SECONDS, urlsplit(url).netloc))
+
+
+    #
+    # 202 Accepted polling
+    #
+
+    async def __poll(self, method: str, request_url: str, request_headers: Dict[str, str], trace_context: SimpleNamespace, request_deadline: float,
+                     response_url: str, response_headers: Any, response_body: bytes):
+        '''
+        follows 202 Accepted + Location until the final response, waiting between polls with exponential backoff,
+        returns 504 if the response is not ready before the deadline
+        '''
+        stats_key = self.__get_poll_stats_key(method, request_url)
+        time_deadline = min(time.monotonic() + self.__poll_deadline, request_deadline)
+        delay = self.__poll_initial_delay
+        polls = 0
 
-    async def request(self, method: str, url: str, *, params: Any = None, data: Any = None, json: Any = None):
         response_status = 202
-        response_text = None
-
-        if 'Referer' in self.__session_headers:
-            self.__session_headers.pop('Referer')
-    
-        while True:
-            async with self.__session.request(method, url, headers = self.__session_headers, params = params, data = data, json = json) as response:
-                response_text = await response.text()
+        while response_status == 202 and 'Location' in response_headers:
+            #server hint takes precedence over own backoff, but it is capped to not wait for too long
+            wait = self.__get_retry_after(response_headers)
+            if wait is None:
+                wait = delay
+                delay = min(delay * self.__poll_backoff, self.__poll_max_delay)
+            else:
+                wait = min(wait, self.RETRY_MAX_DELAY)
+
+            if time.monotonic() + wait > time_deadline:
+                self.__logger.warning('__poll: deadline of %s seconds is exceeded after %s polls for %s' % (self.__poll_deadline, polls, request_url))
+                self.__add_poll_stats(stats_key, polls, True)
+
+                #result is not ready, which is a transient failure rather than a final response
+                return 504, {}, b''
+
+            await asyncio.sleep(wait)
+
+            #conditional headers only apply to the original URL
+            poll_headers = {key: value for key, value in request_headers.items() if not key.startswith('If-')}
+            poll_headers['Referer'] = response_url
+            async with self.__session.request('GET', response_headers['Location'], headers = poll_headers, trace_request_ctx = trace_context) as response:
+                response_body = await response.read()
                 response_status = response.status
-                if response_status == 202 and 'Location' in response.headers:
-                    url = response.headers['Location']
-                    self.__session_headers.update({'Referer': str(response.url)})
-                    method = 'GET'
-                else:
-                    break
+                response_headers = response.headers
+                response_url = str(response.url)
+            polls += 1
 
-        return collections.namedtuple('WgcHttpResponse', ['status', 'text'])(response_status, response_text)
+        self.__add_poll_stats(stats_key, polls, False)
+        return response_status, response_headers, response_body
+
+
+    def __get_retry_after(self, headers: Any) -> float:
+        '''
+        returns delay in seconds from Retry-After header (delta-seconds or HTTP-date) or None
+        '''
+        retry_after = headers.get('Retry-After')
+        if not retry_after:
+            return None
+
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+
+        try:
+            return max(email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            self.__logger.warning('__get_retry_after: failed to parse Retry-After header %s' % retry_after)
+            return None
+
+
+    #
+    # Poll statistics
+    #
+
+    def __get_poll_stats_key(self, method: str, url: str) -> str:
+        url_parts = urlsplit(url)
+        return '%s %s%s' % (method, url_parts.netloc, url_parts.path)
+
+
+    def __add_poll_stats(self, key: str, polls: int, timed_out: bool) -> None:
+        stats = self.__poll_stats.get(key)
+        if stats is None:
+            stats = {'requests': 0, 'polls': 0, 'max_polls': 0, 'last_polls': 0, 'timeouts': 0}
+            self.__poll_stats[key] = stats
+
+        stats['requests'] += 1
+        stats['polls'] += polls
+        stats['max_polls'] = max(stats['max_polls'], polls)
+        stats['last_polls'] = polls
+        if timed_out:
+            stats['timeouts'] += 1
+
+
+    def get_poll_stats(self) -> Dict[str, Dict]:
+        '''
+        returns amount of 202 polls per logical request, keyed by method, host and path of the original URL
+        '''
+        return {key: dict(stats) for key, stats in self.__poll_stats.items()}
 
 
-    async def request_get(self, url: str) -> Any:
-        return await self.request('GET', url)
+    async def request_get(self, url: str, *, params: Any = None, realm: str = None, headers: Dict[str, str] = None, endpoint: str = None,
+                          cache: bool = False) -> WgcHttpResponse:
+        return await self.request('GET', url, params = params, realm = realm, headers = headers, endpoint = endpoint, cache = cache)
 
 
-    async def request_get_simple(self, type: str, realm: str, url: str) -> Any:
-        return await self.request('GET', self.get_url(type, realm, url))
+    async def request_get_simple(self, type: str, realm: str, url: str, *, endpoint: str = None) -> WgcHttpResponse:
+        return await self.request('GET', self.get_url(type, realm, url), realm = realm, endpoint = endpoint)
 
 
-    async def request_post(self, url: str, *, params: Any = None, data: Any = None, json: Any = None) -> Any:
-        return await self.request('POST', url, params = params, data = data, json = json)
+    async def request_post(self, url: str, *, params: Any = None, data: Any = None, json: Any = None, realm: str = None, headers: Dict[str, str] = None,
+                           endpoint: str = None, retry: bool = False) -> WgcHttpResponse:
+        return await self.request('POST', url, params = params, data = data, json = json, realm = realm, headers = headers, endpoint = endpoint, retry = retry)
 
 
-    async def request_post_simple(self, type: str, realm: str, url: str, *, params: Any = None, data: Any = None, json: Any = None) -> Any:
-        return await self.request('POST', self.get_url(type, realm, url), params = params, data = data, json = json)
+    async def request_post_simple(self, type: str, realm: str, url: str, *, params: Any = None, data: Any = None, json: Any = None,
+                                  endpoint: str = None, retry: bool = False) -> WgcHttpResponse:
+        return await self.request('POST', self.get_url(type, realm, url), params = params, data = data, json = json, realm = realm, endpoint = endpoint, retry = retry)
 
@@ -0,0 +1,220 @@
+# (c) 2019-2020 Mikhail Paulyshka
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, List
+
+class WgcHttpCache:
+    '''
+    Disk-backed cache of HTTP GET responses with ETag/Last-Modified revalidation
+
+    Index is changed in memory only, methods which touch files are safe to run in executor
+    and index is written with dump_index() + write_index() when is_dirty() returns True
+    '''
+
+    INDEX_FILE = 'index.json'
+
+    #seconds during which response is served without revalidation, matched by URL substring
+    DEFAULT_TTLS = {
+        '/api/v16/content/showroom/' : 600,
+        '/api/v1/metadata'           : 3600,
+    }
+
+    #request headers which are part of the cache key
+    DEFAULT_VARY = ['Authorization', 'Accept-Language']
+
+    DEFAULT_MAX_SIZE = 32 * 1024 * 1024
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE, ttls: Dict[str, int] = None, vary: List[str] = None):
+        self.__logger = logging.getLogger('wgc_httpcache')
+
+        self.__directory = directory
+        self.__max_size = max_size
+        self.__ttls = ttls if ttls is not None else self.DEFAULT_TTLS
+        self.__vary = vary if vary is not None else self.DEFAULT_VARY
+
+        self.__index = dict()
+        self.__index_dirty = False
+        self.__load_index()
+
+    #
+    # Keys
+    #
+
+    def get_key(self, method: str, url: str, headers: Dict[str, str]) -> str:
+        key = [method.upper(), url]
+        for header in self.__vary:
+            key.append('%s=%s' % (header, headers.get(header, '')))
+
+        return hashlib.sha1('\n'.join(key).encode('utf-8')).hexdigest()
+
+    #
+    # Lookup
+    #
+
+    def get(self, key: str) -> Dict:
+        '''
+        returns cache entry or None, the entry is marked as recently used
+        '''
+        entry = self.__index.get(key)
+        if entry is None:
+            return None
+
+        if not os.path.exists(self.__get_body_path(key)):
+            self.__index.pop(key)
+            self.__index_dirty = True
+            return None
+
+        entry['last_access'] = time.time()
+        return entry
+
+    def is_fresh(self, entry: Dict) -> bool:
+        return time.time() - entry['time'] < self.__get_ttl(entry['url'])
+
+    def get_conditional_headers(self, entry: Dict) -> Dict[str, str]:
+        headers = dict()
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def get_body(self, key: str) -> bytes:
+        '''
+        reads body file, safe to run in executor
+        '''
+        with open(self.__get_body_path(key), 'rb') as body_file:
+            return body_file.read()
+
+    #
+    # Update
+    #
+
+    def is_cacheable(self, url: str, headers: Dict[str, str]) -> bool:
+        if 'no-store' in headers.get('Cache-Control', ''):
+            return False
+
+        return 'ETag' in headers or 'Last-Modified' in headers or self.__get_ttl(url) > 0
+
+    def write_body(self, key: str, body: bytes) -> bool:
+        '''
+        writes body file of the entry before it is added, safe to run in executor
+        '''
+        try:
+            os.makedirs(self.__directory, exist_ok = True)
+            with open(self.__get_body_path(key), 'wb') as body_file:
+                body_file.write(body)
+        except Exception:
+            self.__logger.exception('write_body: failed to write body %s' % key)
+            return False
+
+        return True
+
+    def add(self, key: str, url: str, headers: Dict[str, str], size: int) -> List[str]:
+        '''
+        adds entry whose body is already written, returns keys of evicted entries to be passed to remove_bodies()
+        '''
+        now = time.time()
+        self.__index[key] = {
+            'url'           : url,
+            'etag'          : headers.get('ETag'),
+            'last_modified' : headers.get('Last-Modified'),
+            'size'          : size,
+            'time'          : now,
+            'last_access'   : now
+        }
+        self.__index_dirty = True
+
+        return self.__evict()
+
+    def remove_bodies(self, keys: List[str]) -> None:
+        '''
+        removes body files of evicted entries, safe to run in executor
+        '''
+        for key in keys:
+            try:
+                os.remove(self.__get_body_path(key))
+            except OSError:
+                self.__logger.warning('remove_bodies: failed to remove body %s' % key)
+
+    def revalidated(self, key: str) -> None:
+        '''
+        marks entry as confirmed by the server
+        '''
+        entry = self.__index.get(key)
+        if entry is None:
+            return
+
+        entry['time'] = time.time()
+        self.__index_dirty = True
+
+    #
+    # Index
+    #
+
+    def is_dirty(self) -> bool:
+        return self.__index_dirty
+
+    def dump_index(self) -> str:
+        '''
+        returns serialized index and marks it as saved
+        '''
+        self.__index_dirty = False
+        return json.dumps(self.__index)
+
+    def write_index(self, content: str) -> None:
+        '''
+        writes output of dump_index(), safe to run in executor
+        '''
+        try:
+            os.makedirs(self.__directory, exist_ok = True)
+            with open(os.path.join(self.__directory, self.INDEX_FILE), 'w') as index_file:
+                index_file.write(content)
+        except Exception:
+            self.__logger.exception('write_index: failed to save cache index')
+
+    #
+    # Internals
+    #
+
+    def __get_ttl(self, url: str) -> int:
+        for url_part, ttl in self.__ttls.items():
+            if url_part in url:
+                return ttl
+
+        return 0
+
+    def __get_body_path(self, key: str) -> str:
+        return os.path.join(self.__directory, '%s.body' % key)
+
+    def __evict(self) -> List[str]:
+        '''
+        removes least recently used entries until the cache fits into the size limit, returns their keys
+        '''
+        evicted = list()
+        size = sum(entry['size'] for entry in self.__index.values())
+        for key, entry in sorted(self.__index.items(), key = lambda item: item[1]['last_access']):
+            if size <= self.__max_size:
+                break
+
+            size -= entry['size']
+            self.__index.pop(key)
+            evicted.append(key)
+
+        return evicted
+
+    def __load_index(self) -> None:
+        index_path = os.path.join(self.__directory, self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+
+        try:
+            with open(index_path, 'r') as index_file:
+                self.__index = json.load(index_file)
+        except Exception:
+            self.__logger.exception('__load_index: failed to load cache index, cache is reset')
+            self.__index = dict()
@@ -0,0 +1,222 @@
+# (c) 2019-2020 Mikhail Paulyshka
+# SPDX-License-Identifier: MIT
+
+import time
+from typing import Dict
+
+import aiohttp
+
+class WgcHttpPoolStats:
+    '''
+    Connection reuse counters of aiohttp session collected via TraceConfig
+    '''
+
+    def __init__(self):
+        self.__requests = 0
+        self.__hosts = dict()
+
+        self.__trace_config = aiohttp.TraceConfig()
+        self.__trace_config.on_request_start.append(self.__on_request_start)
+        self.__trace_config.on_connection_create_end.append(self.__on_connection_create_end)
+        self.__trace_config.on_connection_reuseconn.append(self.__on_connection_reuseconn)
+
+    def get_trace_config(self) -> aiohttp.TraceConfig:
+        return self.__trace_config
+
+    #
+    # Trace callbacks
+    #
+
+    async def __on_request_start(self, session, context, params) -> None:
+        #connection signals do not carry URL, so it is kept in the per-request context
+        context.url = params.url
+        self.__requests += 1
+
+    async def __on_connection_create_end(self, session, context, params) -> None:
+        host = self.__get_host(context)
+        host['connections_created'] += 1
+
+        #every new HTTPS connection starts with a full TLS handshake
+        if context.url.scheme == 'https':
+            host['tls_handshakes'] += 1
+
+    async def __on_connection_reuseconn(self, session, context, params) -> None:
+        self.__get_host(context)['connections_reused'] += 1
+
+    def __get_host(self, context) -> Dict[str, int]:
+        hostname = context.url.host
+        host = self.__hosts.get(hostname)
+        if host is None:
+            host = {'connections_created': 0, 'connections_reused': 0, 'tls_handshakes': 0}
+            self.__hosts[hostname] = host
+        return host
+
+    #
+    # Stats
+    #
+
+    def get_stats(self, connector: aiohttp.TCPConnector) -> Dict:
+        '''
+        returns JSON-serializable pool state of the connector together with reuse counters,
+        open, idle and acquired connections are None if the connector does not expose them
+        '''
+        idle, acquired = self.__get_pool_state(connector)
+
+        hosts = dict()
+        for hostname, host in self.__hosts.items():
+            hosts[hostname] = dict(host, reuse_ratio = self.__get_reuse_ratio(host))
+
+        totals = {'connections_created': 0, 'connections_reused': 0, 'tls_handshakes': 0}
+        for host in self.__hosts.values():
+            for key in totals:
+                totals[key] += host[key]
+
+        return dict(totals,
+            limit = connector.limit,
+            limit_per_host = connector.limit_per_host,
+            open = idle + acquired if idle is not None else None,
+            idle = idle,
+            acquired = acquired,
+            requests = self.__requests,
+            reuse_ratio = self.__get_reuse_ratio(totals),
+            hosts = hosts)
+
+    def __get_pool_state(self, connector: aiohttp.TCPConnector):
+        '''
+        returns amount of idle and acquired connections or (None, None)
+        '''
+        #aiohttp has no public API for pool state, private attributes differ between versions
+        connections_idle = getattr(connector, '_conns', None)
+        connections_acquired = getattr(connector, '_acquired', None)
+        if connections_idle is None or connections_acquired is None:
+            return None, None
+
+        try:
+            return sum(len(connections) for connections in connections_idle.values()), len(connections_acquired)
+        except (AttributeError, TypeError):
+            return None, None
+
+    def __get_reuse_ratio(self, counters: Dict[str, int]) -> float:
+        connections = counters['connections_created'] + counters['connections_reused']
+        if connections == 0:
+            return None
+
+        return counters['connections_reused'] / connections
+
+
+class WgcHttpLatencyStats:
+    '''
+    Latency histograms of aiohttp requests per logical endpoint collected via TraceConfig
+    '''
+
+    #upper bounds of histogram buckets in milliseconds
+    BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+    #connect includes TLS handshake, aiohttp 3.6 has no separate signal for it
+    PHASES = ['dns', 'connect', 'ttfb', 'body']
+
+    def __init__(self):
+        self.__endpoints = dict()
+
+        self.__trace_config = aiohttp.TraceConfig()
+        self.__trace_config.on_request_start.append(self.__on_request_start)
+        self.__trace_config.on_dns_resolvehost_start.append(self.__on_dns_resolvehost_start)
+        self.__trace_config.on_dns_resolvehost_end.append(self.__on_dns_resolvehost_end)
+        self.__trace_config.on_connection_create_start.append(self.__on_connection_create_start)
+        self.__trace_config.on_connection_create_end.append(self.__on_connection_create_end)
+        self.__trace_config.on_request_end.append(self.__on_request_end)
+        self.__trace_config.on_response_chunk_received.append(self.__on_response_chunk_received)
+
+    def get_trace_config(self) -> aiohttp.TraceConfig:
+        return self.__trace_config
+
+    #
+    # Trace callbacks
+    #
+
+    async def __on_request_start(self, session, context, params) -> None:
+        request_context = context.trace_request_ctx
+        context.endpoint = getattr(request_context, 'endpoint', None) or params.url.host
+        context.time_start = time.monotonic()
+        context.time_headers = None
+        context.dns = 0.0
+
+    async def __on_dns_resolvehost_start(self, session, context, params) -> None:
+        context.time_dns = time.monotonic()
+
+    async def __on_dns_resolvehost_end(self, session, context, params) -> None:
+        duration = time.monotonic() - context.time_dns
+        context.dns += duration
+        self.__add(context.endpoint, 'dns', duration)
+
+    async def __on_connection_create_start(self, session, context, params) -> None:
+        context.time_connect = time.monotonic()
+        context.dns_before_connect = context.dns
+
+    async def __on_connection_create_end(self, session, context, params) -> None:
+        #host is resolved while connection is created
+        duration = time.monotonic() - context.time_connect - (context.dns - context.dns_before_connect)
+        self.__add(context.endpoint, 'connect', duration)
+
+    async def __on_request_end(self, session, context, params) -> None:
+        #signal is sent once response headers are received
+        context.time_headers = time.monotonic()
+        self.__add(context.endpoint, 'ttfb', context.time_headers - context.time_start)
+
+    async def __on_response_chunk_received(self, session, context, params) -> None:
+        #response.read() reports the whole body at once
+        if context.time_headers is None:
+            return
+
+        self.__add(context.endpoint, 'body', time.monotonic() - context.time_headers)
+        context.time_headers = None
+
+    #
+    # Histograms
+    #
+
+    def __add(self, endpoint: str, phase: str, duration: float) -> None:
+        endpoint_stats = self.__endpoints.get(endpoint)
+        if endpoint_stats is None:
+            endpoint_stats = dict()
+            self.__endpoints[endpoint] = endpoint_stats
+
+        histogram = endpoint_stats.get(phase)
+        if histogram is None:
+            histogram = {'count': 0, 'sum_ms': 0.0, 'max_ms': 0.0, 'buckets': [0] * (len(self.BUCKETS) + 1)}
+            endpoint_stats[phase] = histogram
+
+        duration_ms = duration * 1000
+        histogram['count'] += 1
+        histogram['sum_ms'] += duration_ms
+        histogram['max_ms'] = max(histogram['max_ms'], duration_ms)
+
+        for index, bound in enumerate(self.BUCKETS):
+            if duration_ms <= bound:
+                histogram['buckets'][index] += 1
+                break
+        else:
+            histogram['buckets'][-1] += 1
+
+    def get_stats(self) -> Dict:
+        '''
+        returns JSON-serializable histograms keyed by endpoint and phase, bucket keys are upper bounds in milliseconds
+        '''
+        bounds = [str(bound) for bound in self.BUCKETS] + ['inf']
+
+        result = dict()
+        for endpoint, endpoint_stats in self.__endpoints.items():
+            result[endpoint] = dict()
+            for phase in self.PHASES:
+                histogram = endpoint_stats.get(phase)
+                if histogram is None:
+                    continue
+
+                result[endpoint][phase] = {
+                    'count': histogram['count'],
+                    'mean_ms': histogram['sum_ms'] / histogram['count'],
+                    'max_ms': histogram['max_ms'],
+                    'buckets': dict(zip(bounds, histogram['buckets']))
+                }
+
+        return result
@@ -2,12 +2,28 @@
 # Joseph Birr-Pixton,https://github.com/ctz/keccak
 # Finian Blackett, https://github.com/ThePlasmaRailgun
 
+import logging
 from math import log
 from operator import xor
-from copy import deepcopy
 from functools import reduce
+from struct import Struct
 from sys import version_info
 
+try:
+    import sha3 as pysha3
+except ImportError:
+    pysha3 = None
+
+try:
+    from Crypto.Hash import keccak as pycryptodome_keccak
+except ImportError:
+    pycryptodome_keccak = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # The Keccak-f round constants.
 RoundConstants = [
     0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
@@ -73,6 +89,18 @@ def multirate_padding(used_bytes, align_bytes):
     else:
         return [0x01] + ([0x00] * (padlen - 2)) + [0x80]
 
+def zero_prefix_masks(nibbles):
+    """
+    Returns (lane index, bit mask) pairs of the squeezed state which must be zero
+    for the hex digest to start with the given amount of zero nibbles.
+    """
+    masks = [0] * ((nibbles + 15) // 16)
+    for nibble in range(nibbles):
+        byte = nibble // 2
+        masks[byte // 8] |= 0xf << ((byte % 8) * 8 + (4 if nibble % 2 == 0 else 0))
+    return list(enumerate(masks))
+
+
 def keccak_f(state):
     """
     This is Keccak-f permutation.  It operates on and
@@ -113,6 +141,152 @@ def keccak_f(state):
         round(state.s, RoundConstants[ir])
 
 
+def keccak_f1600_flat(state):
+    """
+    This is Keccak-f[1600] permutation specialised for 64-bit lanes.
+    It operates on and mutates the passed-in KeccakFlatState.  It returns nothing.
+
+    Rounds are unrolled from RotationConstants, lane (x, y) is kept in local a{x + 5 * y}.
+    """
+    a = state.s
+    (a0, a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11, a12, a13, a14, a15, a16, a17, a18, a19, a20, a21, a22, a23, a24) = a
+
+    for rc in RoundConstants:
+        # theta
+        c0 = a0 ^ a5 ^ a10 ^ a15 ^ a20
+        c1 = a1 ^ a6 ^ a11 ^ a16 ^ a21
+        c2 = a2 ^ a7 ^ a12 ^ a17 ^ a22
+        c3 = a3 ^ a8 ^ a13 ^ a18 ^ a23
+        c4 = a4 ^ a9 ^ a14 ^ a19 ^ a24
+        d0 = c4 ^ (((c1 << 1) & 0xFFFFFFFFFFFFFFFF) | (c1 >> 63))
+        d1 = c0 ^ (((c2 << 1) & 0xFFFFFFFFFFFFFFFF) | (c2 >> 63))
+        d2 = c1 ^ (((c3 << 1) & 0xFFFFFFFFFFFFFFFF) | (c3 >> 63))
+        d3 = c2 ^ (((c4 << 1) & 0xFFFFFFFFFFFFFFFF) | (c4 >> 63))
+        d4 = c3 ^ (((c0 << 1) & 0xFFFFFFFFFFFFFFFF) | (c0 >> 63))
+
+        # rho and pi
+        b0 = a0 ^ d0
+        t = a6 ^ d1
+        b1 = ((t << 44) & 0xFFFFFFFFFFFFFFFF) | (t >> 20)
+        t = a12 ^ d2
+        b2 = ((t << 43) & 0xFFFFFFFFFFFFFFFF) | (t >> 21)
+        t = a18 ^ d3
+        b3 = ((t << 21) & 0xFFFFFFFFFFFFFFFF) | (t >> 43)
+        t = a24 ^ d4
+        b4 = ((t << 14) & 0xFFFFFFFFFFFFFFFF) | (t >> 50)
+        t = a3 ^ d3
+        b5 = ((t << 28) & 0xFFFFFFFFFFFFFFFF) | (t >> 36)
+        t = a9 ^ d4
+        b6 = ((t << 20) & 0xFFFFFFFFFFFFFFFF) | (t >> 44)
+        t = a10 ^ d0
+        b7 = ((t << 3) & 0xFFFFFFFFFFFFFFFF) | (t >> 61)
+        t = a16 ^ d1
+        b8 = ((t << 45) & 0xFFFFFFFFFFFFFFFF) | (t >> 19)
+        t = a22 ^ d2
+        b9 = ((t << 61) & 0xFFFFFFFFFFFFFFFF) | (t >> 3)
+        t = a1 ^ d1
+        b10 = ((t << 1) & 0xFFFFFFFFFFFFFFFF) | (t >> 63)
+        t = a7 ^ d2
+        b11 = ((t << 6) & 0xFFFFFFFFFFFFFFFF) | (t >> 58)
+        t = a13 ^ d3
+        b12 = ((t << 25) & 0xFFFFFFFFFFFFFFFF) | (t >> 39)
+        t = a19 ^ d4
+        b13 = ((t << 8) & 0xFFFFFFFFFFFFFFFF) | (t >> 56)
+        t = a20 ^ d0
+        b14 = ((t << 18) & 0xFFFFFFFFFFFFFFFF) | (t >> 46)
+        t = a4 ^ d4
+        b15 = ((t << 27) & 0xFFFFFFFFFFFFFFFF) | (t >> 37)
+        t = a5 ^ d0
+        b16 = ((t << 36) & 0xFFFFFFFFFFFFFFFF) | (t >> 28)
+        t = a11 ^ d1
+        b17 = ((t << 10) & 0xFFFFFFFFFFFFFFFF) | (t >> 54)
+        t = a17 ^ d2
+        b18 = ((t << 15) & 0xFFFFFFFFFFFFFFFF) | (t >> 49)
+        t = a23 ^ d3
+        b19 = ((t << 56) & 0xFFFFFFFFFFFFFFFF) | (t >> 8)
+        t = a2 ^ d2
+        b20 = ((t << 62) & 0xFFFFFFFFFFFFFFFF) | (t >> 2)
+        t = a8 ^ d3
+        b21 = ((t << 55) & 0xFFFFFFFFFFFFFFFF) | (t >> 9)
+        t = a14 ^ d4
+        b22 = ((t << 39) & 0xFFFFFFFFFFFFFFFF) | (t >> 25)
+        t = a15 ^ d0
+        b23 = ((t << 41) & 0xFFFFFFFFFFFFFFFF) | (t >> 23)
+        t = a21 ^ d1
+        b24 = ((t << 2) & 0xFFFFFFFFFFFFFFFF) | (t >> 62)
+
+        # chi and iota
+        a0 = b0 ^ (~b1 & b2) ^ rc
+        a1 = b1 ^ (~b2 & b3)
+        a2 = b2 ^ (~b3 & b4)
+        a3 = b3 ^ (~b4 & b0)
+        a4 = b4 ^ (~b0 & b1)
+        a5 = b5 ^ (~b6 & b7)
+        a6 = b6 ^ (~b7 & b8)
+        a7 = b7 ^ (~b8 & b9)
+        a8 = b8 ^ (~b9 & b5)
+        a9 = b9 ^ (~b5 & b6)
+        a10 = b10 ^ (~b11 & b12)
+        a11 = b11 ^ (~b12 & b13)
+        a12 = b12 ^ (~b13 & b14)
+        a13 = b13 ^ (~b14 & b10)
+        a14 = b14 ^ (~b10 & b11)
+        a15 = b15 ^ (~b16 & b17)
+        a16 = b16 ^ (~b17 & b18)
+        a17 = b17 ^ (~b18 & b19)
+        a18 = b18 ^ (~b19 & b15)
+        a19 = b19 ^ (~b15 & b16)
+        a20 = b20 ^ (~b21 & b22)
+        a21 = b21 ^ (~b22 & b23)
+        a22 = b22 ^ (~b23 & b24)
+        a23 = b23 ^ (~b24 & b20)
+        a24 = b24 ^ (~b20 & b21)
+
+    a[:] = (a0, a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11, a12, a13, a14, a15, a16, a17, a18, a19, a20, a21, a22, a23, a24)
+
+
+# Keccak-f[1600] rho and pi for flat lanes: destination lane is fed from
+# source lane rotated left, lane (x, y) is at index x + 5 * y.
+FlatPiSources = [0] * 25
+FlatRhoRotations = [0] * 25
+for _x in range(5):
+    for _y in range(5):
+        FlatPiSources[_y + 5 * ((2 * _x + 3 * _y) % 5)] = _x + 5 * _y
+        FlatRhoRotations[_y + 5 * ((2 * _x + 3 * _y) % 5)] = RotationConstants[_y][_x]
+
+
+def keccak_f1600_batch(a):
+    """
+    This is Keccak-f[1600] permutation over many states at once.
+    It operates on and mutates the passed-in (25, N) uint64 numpy array.  It returns nothing.
+    """
+    n = a.shape[1]
+    a3 = a.reshape(5, 5, n)
+
+    sources = numpy.array(FlatPiSources)
+    left = numpy.array(FlatRhoRotations, dtype=numpy.uint64).reshape(25, 1)
+    # rotation by 0 is kept as (t << 0) | (t >> 0)
+    right = numpy.array([(64 - r) % 64 for r in FlatRhoRotations], dtype=numpy.uint64).reshape(25, 1)
+    one = numpy.uint64(1)
+    sixtythree = numpy.uint64(63)
+
+    for rc in RoundConstants:
+        # theta
+        c = a3[0] ^ a3[1] ^ a3[2] ^ a3[3] ^ a3[4]
+        c_next = numpy.roll(c, -1, axis=0)
+        a3 ^= numpy.roll(c, 1, axis=0) ^ ((c_next << one) | (c_next >> sixtythree))
+
+        # rho and pi
+        t = a[sources]
+        b3 = ((t << left) | (t >> right)).reshape(5, 5, n)
+
+        # chi
+        numpy.bitwise_xor(b3, ~numpy.roll(b3, -1, axis=1) & numpy.roll(b3, -2, axis=1), out=a3)
+
+        # iota
+        a[0] ^= numpy.uint64(rc)
+
+
 class KeccakState(object):
     """
     A keccak state container.
@@ -165,10 +339,7 @@ class KeccakState(object):
         """
         Converts a sequence of byte values to a lane.
         """
-        r = 0
-        for b in reversed(bb):
-            r = r << 8 | b
-        return r
+        return int.from_bytes(bb, 'little')
 
     @staticmethod
     def bytes2str(bl: list) -> bytes:
@@ -195,18 +366,37 @@ class KeccakState(object):
         assert self.b % 25 == 0
         self.lanew = self.b // 25
 
+        # 64-bit lanes of the rate are unpacked at once
+        self.rate_struct = None
+        if self.lanew == 64 and self.bitrate % 64 == 0:
+            self.rate_struct = Struct('<%dQ' % (self.bitrate // 64))
+
         self.s = KeccakState.zero()
 
     def __str__(self):
         return KeccakState.format(self.s)
 
+    def copy(self):
+        """
+        Returns a copy of the state, duplicating only the lane table.
+        """
+        other = KeccakState.__new__(KeccakState)
+        other.__dict__.update(self.__dict__)
+        other.s = [column[:] for column in self.s]
+        return other
+
     def absorb(self, bb):
         """
         Mixes in the given bitrate-length string to the state.
         """
         assert len(bb) == self.bitrate_bytes
 
-        bb += [0] * bits2bytes(self.b - self.bitrate)
+        if self.rate_struct is not None:
+            for i, lane in enumerate(self.rate_struct.unpack(bb)):
+                self.s[i % self.w][i // self.w] ^= lane
+            return
+
+        bb = bytes(bb) + bytes(bits2bytes(self.b - self.bitrate))
         i = 0
 
         for y in self.rangeH:
@@ -220,6 +410,12 @@ class KeccakState(object):
         """
         return self.get_bytes()[:self.bitrate_bytes]
 
+    def get_lane(self, i):
+        """
+        Returns the lane at the given position in output order.
+        """
+        return self.s[i % self.w][i // self.w]
+
     def get_bytes(self):
         """
         Convert whole state to a byte string.
@@ -245,15 +441,91 @@ class KeccakState(object):
                 i += 8
 
 
+class KeccakFlatState(object):
+    """
+    A Keccak-f[1600] state container.
+
+    The state is stored as a flat list of 25 lanes, lane (x, y) is at index x + 5 * y.
+    """
+    b = 1600
+    lanew = 64
+
+    def __init__(self, bitrate, b):
+        self.bitrate = bitrate
+
+        # only lane-aligned
+        assert b == KeccakFlatState.b
+        assert self.bitrate % self.lanew == 0
+        self.bitrate_bytes = bits2bytes(self.bitrate)
+        self.bitrate_lanes = self.bitrate // self.lanew
+
+        self.rate_struct = Struct('<%dQ' % self.bitrate_lanes)
+        self.state_struct = Struct('<25Q')
+
+        self.s = [0] * 25
+
+    def __str__(self):
+        return KeccakState.format([self.s[x::5] for x in KeccakState.rangeW])
+
+    def copy(self):
+        """
+        Returns a copy of the state, duplicating only the lane list.
+        """
+        other = KeccakFlatState.__new__(KeccakFlatState)
+        other.__dict__.update(self.__dict__)
+        other.s = self.s[:]
+        return other
+
+    def absorb(self, bb):
+        """
+        Mixes in the given bitrate-length string to the state.
+        """
+        assert len(bb) == self.bitrate_bytes
+
+        s = self.s
+        for i, lane in enumerate(self.rate_struct.unpack(bb)):
+            s[i] ^= lane
+
+    def squeeze(self):
+        """
+        Returns the bitrate-length prefix of the state to be output.
+        """
+        return list(self.rate_struct.pack(*self.s[:self.bitrate_lanes]))
+
+    def get_lane(self, i):
+        """
+        Returns the lane at the given position in output order.
+        """
+        return self.s[i]
+
+    def get_bytes(self):
+        """
+        Convert whole state to a byte string.
+        """
+        return list(self.state_struct.pack(*self.s))
+
+    def set_bytes(self, bb):
+        """
+        Set whole state from byte string, which is assumed
+        to be the correct length.
+        """
+        self.s = list(self.state_struct.unpack(bytes(bb)))
+
+
 class KeccakSponge(object):
-    def __init__(self, bitrate, width, padfn, permfn):
-        self.state = KeccakState(bitrate, width)
+    def __init__(self, bitrate, width, padfn, permfn, statefn=KeccakState):
+        self.state = statefn(bitrate, width)
         self.padfn = padfn
         self.permfn = permfn
-        self.buffer = []
+        self.buffer = bytearray()
 
     def copy(self):
-        return deepcopy(self)
+        other = KeccakSponge.__new__(KeccakSponge)
+        other.state = self.state.copy()
+        other.padfn = self.padfn
+        other.permfn = self.permfn
+        other.buffer = self.buffer[:]
+        return other
 
     def absorb_block(self, bb):
         assert len(bb) == self.state.bitrate_bytes
@@ -261,41 +533,62 @@ class KeccakSponge(object):
         self.permfn(self.state)
 
     def absorb(self, bs: bytes):
-        self.buffer += KeccakState.str2bytes(bs)
+        rate = self.state.bitrate_bytes
+        data = memoryview(bs).cast('B')
+        offset = 0
 
-        while len(self.buffer) >= self.state.bitrate_bytes:
-            self.absorb_block(self.buffer[:self.state.bitrate_bytes])
-            self.buffer = self.buffer[self.state.bitrate_bytes:]
+        # complete the pending block first
+        if self.buffer:
+            offset = min(rate - len(self.buffer), len(data))
+            self.buffer += data[:offset]
+            if len(self.buffer) < rate:
+                return
 
+            self.absorb_block(self.buffer)
+            self.buffer = bytearray()
+
+        # whole blocks are absorbed straight from the input, only the tail is buffered
+        end = len(data) - (len(data) - offset) % rate
+        while offset < end:
+            self.absorb_block(data[offset:offset + rate])
+            offset += rate
+
+        self.buffer += data[offset:]
 
     def absorb_final(self):
-        padded = self.buffer + self.padfn(len(self.buffer), self.state.bitrate_bytes)
+        padded = bytes(self.buffer) + bytes(self.padfn(len(self.buffer), self.state.bitrate_bytes))
         self.absorb_block(padded)
-        self.buffer = []
-
-    def squeeze_once(self):
-        rc = self.state.squeeze()
-        self.permfn(self.state)
-        return rc
+        self.buffer = bytearray()
 
     def squeeze(self, l):
-        z = self.squeeze_once()
+        # the state is permuted only when one more block is needed
+        z = self.state.squeeze()
         while len(z) < l:
-            z += self.squeeze_once()
+            self.permfn(self.state)
+            z += self.state.squeeze()
         return z[:l]
 
 
+# Keccak-f engines: state container and permutation
+KeccakEngines = {
+    'reference': (KeccakState, keccak_f),
+    'flat': (KeccakFlatState, keccak_f1600_flat),
+}
+
+
 class KeccakHash(object):
     """
     The Keccak hash function, with a hashlib-compatible interface.
     """
 
-    def __init__(self, bitrate_bits, capacity_bits, output_bits):
+    def __init__(self, bitrate_bits, capacity_bits, output_bits, engine='reference'):
         # our in-absorption sponge. this is never given padding
         assert bitrate_bits + capacity_bits in (25, 50, 100, 200, 400, 800, 1600)
+        statefn, permfn = KeccakEngines[engine]
         self.sponge = KeccakSponge(bitrate_bits, bitrate_bits + capacity_bits,
                                    multirate_padding,
-                                   keccak_f)
+                                   permfn,
+                                   statefn)
 
         # hashlib interface members
         assert output_bits % 8 == 0
@@ -309,7 +602,14 @@ class KeccakHash(object):
         return '<KeccakHash with r=%d, c=%d, image=%d>' % inf
 
     def copy(self):
-        return deepcopy(self)
+        """
+        Returns a copy of the hash, the absorbed input is not processed again.
+        """
+        other = KeccakHash.__new__(KeccakHash)
+        other.sponge = self.sponge.copy()
+        other.digest_size = self.digest_size
+        other.block_size = self.block_size
+        return other
 
     def update(self, bs: bytes):
         self.sponge.absorb(bs)
@@ -323,20 +623,226 @@ class KeccakHash(object):
     def hexdigest(self):
         return hexlify(self.digest())
 
+    def digest_has_zero_prefix(self, nibbles):
+        """
+        Returns True if the hex digest starts with the given amount of zero nibbles.
+
+        Finalises a throwaway copy of the lanes and inspects only the lanes
+        covering the prefix, without building the digest.
+        """
+        assert self.sponge.state.lanew == 64 and nibbles <= self.digest_size * 2
+
+        sponge = self.sponge
+        state = sponge.state.copy()
+        state.absorb(bytes(sponge.buffer) + bytes(sponge.padfn(len(sponge.buffer), state.bitrate_bytes)))
+        sponge.permfn(state)
+
+        for lane, mask in zero_prefix_masks(nibbles):
+            if state.get_lane(lane) & mask:
+                return False
+        return True
+
     @staticmethod
-    def preset(bitrate_bits, capacity_bits, output_bits):
+    def preset(bitrate_bits, capacity_bits, output_bits, engine='reference'):
         """
-        Returns a factory function for the given bitrate, sponge capacity and output length.
+        Returns a factory function for the given bitrate, sponge capacity, output length and engine.
         The function accepts an optional initial input, ala hashlib.
         """
 
         def create(initial_input=None):
-            h = KeccakHash(bitrate_bits, capacity_bits, output_bits)
+            h = KeccakHash(bitrate_bits, capacity_bits, output_bits, engine)
             if initial_input is not None:
                 h.update(initial_input)
             return h
 
         return create
 
+class PyCryptodomeKeccakHash(object):
+    """
+    The Keccak hash function from pycryptodome, with a hashlib-compatible interface.
+
+    pycryptodome hash objects can not be copied, so the absorbed input
+    is kept and replayed into a new object on copy().
+    """
+
+    def __init__(self, output_bits, initial_input=b''):
+        self.digest_size = bits2bytes(output_bits)
+        self.block_size = bits2bytes(1600 - 2 * output_bits)
+
+        self.data = bytearray(initial_input)
+        self.hash = pycryptodome_keccak.new(digest_bits=output_bits, data=initial_input, update_after_digest=True)
+
+    def __repr__(self):
+        return '<PyCryptodomeKeccakHash with image=%d>' % (self.digest_size * 8)
+
+    def copy(self):
+        return PyCryptodomeKeccakHash(self.digest_size * 8, bytes(self.data))
+
+    def update(self, bs: bytes):
+        self.data += bs
+        self.hash.update(bs)
+
+    def digest(self):
+        return self.hash.digest()
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+class Keccak512Batch(object):
+    """
+    Keccak-512 over many messages which share a common prefix.
+
+    The prefix is absorbed once, then the messages are finished together
+    as a (25, N) uint64 numpy array of states.
+    """
+    bitrate_bytes = 72
+
+    @staticmethod
+    def is_available():
+        return numpy is not None
+
+    def __init__(self, prefix: bytes):
+        state = KeccakFlatState(self.bitrate_bytes * 8, 1600)
+
+        absorbed = len(prefix) - len(prefix) % self.bitrate_bytes
+        for offset in range(0, absorbed, self.bitrate_bytes):
+            state.absorb(prefix[offset:offset + self.bitrate_bytes])
+            keccak_f1600_flat(state)
+
+        self.lanes = numpy.array(state.s, dtype=numpy.uint64).reshape(25, 1)
+        self.tail = numpy.frombuffer(prefix[absorbed:], dtype=numpy.uint8)
+
+    def zero_prefix_mask(self, suffixes, nibbles):
+        """
+        Returns boolean mask of the suffixes for which hex digest
+        of prefix + suffix starts with the given amount of zero nibbles.
+        All suffixes must have the same length.
+        """
+        count = len(suffixes)
+        tail_length = len(self.tail)
+        message_length = tail_length + len(suffixes[0])
+        padded_length = (message_length // self.bitrate_bytes + 1) * self.bitrate_bytes
+
+        # multirate padding, 0x01 and 0x80 are merged into 0x81 for the single padding byte
+        blocks = numpy.zeros((count, padded_length), dtype=numpy.uint8)
+        blocks[:, :tail_length] = self.tail
+        blocks[:, tail_length:message_length] = numpy.frombuffer(b''.join(suffixes), dtype=numpy.uint8).reshape(count, -1)
+        blocks[:, message_length] |= 0x01
+        blocks[:, padded_length - 1] |= 0x80
+        blocks = blocks.view('<u8')
+
+        states = numpy.repeat(self.lanes, count, axis=1)
+        rate_lanes = self.bitrate_bytes // 8
+        for block in range(padded_length // self.bitrate_bytes):
+            states[:rate_lanes] ^= blocks[:, block * rate_lanes:(block + 1) * rate_lanes].T
+            keccak_f1600_batch(states)
+
+        mask = numpy.ones(count, dtype=bool)
+        for lane, bits in zero_prefix_masks(nibbles):
+            mask &= (states[lane] & numpy.uint64(bits)) == 0
+        return mask
+
+
 # Keccak parameter presets
-Keccak512 = KeccakHash.preset(576, 1024, 512)
+Keccak512Reference = KeccakHash.preset(576, 1024, 512)
+Keccak512Flat = KeccakHash.preset(576, 1024, 512, 'flat')
+
+
+def keccak512_pysha3(initial_input=None):
+    return pysha3.keccak_512(initial_input) if initial_input is not None else pysha3.keccak_512()
+
+
+def keccak512_pycryptodome(initial_input=None):
+    return PyCryptodomeKeccakHash(512, initial_input if initial_input is not None else b'')
+
+
+# Keccak-512 known answers: input, digest
+Keccak512TestVectors = [
+    (b'', '0eab42de4c3ceb9235fc91acffe746b29c29a8c366b7c60e4e67c466f36a4304'
+          'c00fa9caf9d87976ba469bcbe06713b435f091ef2769fb160cdab33d3670680e'),
+    (b'abc', '18587dc2ea106b9a1563e32b3312421ca164c7f1f07bc922a9c83d77cea3a1e5'
+             'd0c69910739025372dc14ac9642629379540c17e2a65b19d77aa511a9d00bb96'),
+    (b'The quick brown fox jumps over the lazy dog',
+     'd135bb84d0439dbac432247ee573a23ea7d3c9deb2a968eb31d47c4fb45f1ef4'
+     '422d6c531b5b9bd6f449ebcc449ea94d0a8f05f62130fda612da53c79659f609'),
+    (bytes(range(200)), 'f452d81b62b961f8023f8228cbe780379b36c49ddcef29e0dffb01a930c2cc53'
+                        'a694ed6ae3f0d224a2f1be55814a81841b90d56bcdf4a48a633f258a32dc14fc'),
+]
+
+
+def check_backend(factory):
+    """
+    Checks that the given Keccak-512 factory produces known answers,
+    both for whole inputs and for inputs fed in two parts through a copy.
+    """
+    for data, expected in Keccak512TestVectors:
+        if hexlify(factory(data).digest()) != expected:
+            return False
+
+        prefix = factory(data[:len(data) // 3])
+        candidate = prefix.copy()
+        candidate.update(data[len(data) // 3:])
+        if candidate.hexdigest() != expected:
+            return False
+
+    return True
+
+
+# Keccak-512 backends in the order of preference: name, factory, availability
+# pycryptodome is bundled by download_deps, pysha3 is not bundled and is used only if already importable
+Keccak512Candidates = [
+    ('pysha3', keccak512_pysha3, pysha3 is not None and hasattr(pysha3, 'keccak_512')),
+    ('pycryptodome', keccak512_pycryptodome, pycryptodome_keccak is not None),
+    ('flat', Keccak512Flat, True),
+    ('reference', Keccak512Reference, True),
+]
+
+# Keccak-512 backends which are available and have passed the known answer tests
+Keccak512Backends = dict()
+
+
+def register_backend(name, factory):
+    """
+    Registers Keccak-512 factory if it passes the known answer tests.
+    """
+    try:
+        passed = check_backend(factory)
+    except Exception:
+        logging.getLogger('wgc_keccak').exception('register_backend: backend %s failed' % name)
+        passed = False
+
+    if not passed:
+        logging.getLogger('wgc_keccak').error('register_backend: backend %s produces wrong digests' % name)
+        return False
+
+    Keccak512Backends[name] = factory
+    return True
+
+
+def get_backend():
+    """
+    Returns name of the active Keccak-512 backend.
+    """
+    return next(iter(Keccak512Backends))
+
+
+def get_backends():
+    """
+    Returns names of all registered Keccak-512 backends, the active one goes first.
+    """
+    return list(Keccak512Backends)
+
+
+def Keccak512(initial_input=None):
+    """
+    Creates Keccak-512 hash using the active backend.
+    """
+    return Keccak512Backends[get_backend()](initial_input)
+
+
+for backend_name, backend_factory, backend_available in Keccak512Candidates:
+    if backend_available:
+        register_backend(backend_name, backend_factory)
+
+logging.getLogger('wgc_keccak').info('Keccak-512 backend: %s' % get_backend())
@@ -0,0 +1,370 @@
+# (c) 2019-2020 Mikhail Paulyshka
+# SPDX-License-Identifier: MIT
+
+import concurrent.futures
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from .wgc_keccak import Keccak512, Keccak512Batch, KeccakFlatState, get_backend, keccak_f1600_flat, zero_prefix_masks
+
+#amount of nonces scanned between progress updates and by one worker task
+POW_BLOCK_SIZE = 1024
+
+#expected solving time in seconds below which the solver runs right in the event loop
+POW_INLINE_SECONDS = 0.05
+
+#expected solving time in seconds above which it is worth to start worker processes
+POW_MULTIPROCESS_SECONDS = 2.0
+
+#minimal duration in seconds of the calibration run
+POW_CALIBRATION_SECONDS = 0.05
+
+#proof-of-work solving strategies
+POW_STRATEGY_INLINE = 'inline'
+POW_STRATEGY_EXECUTOR = 'executor'
+POW_STRATEGY_MULTIPROCESS = 'multiprocess'
+
+#Keccak512 backends which are outperformed by the in-place flat solver
+POW_PYTHON_BACKENDS = ['flat', 'reference']
+
+
+class HashcashProgress(object):
+    '''
+    cancellation token and progress of proof-of-work calculation
+    '''
+
+    def __init__(self, complexity: int):
+        self.__lock = threading.Lock()
+
+        self.complexity = complexity
+        self.nonces_tried = 0
+        self.time_start = time.monotonic()
+
+        self.cancelled = False
+        self.finished = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def add_nonces(self, count: int) -> None:
+        with self.__lock:
+            self.nonces_tried += count
+
+    def finish(self) -> None:
+        self.finished = True
+
+    def get_status(self) -> Dict:
+        '''
+        returns progress as JSON-serializable dictionary
+        '''
+        nonces_expected = 16 ** self.complexity
+        seconds_elapsed = time.monotonic() - self.time_start
+
+        seconds_remaining = None
+        if self.nonces_tried and seconds_elapsed > 0:
+            seconds_remaining = max(nonces_expected - self.nonces_tried, 0) * seconds_elapsed / self.nonces_tried
+
+        return {
+            'complexity': self.complexity,
+            'nonces_tried': self.nonces_tried,
+            'nonces_expected': nonces_expected,
+            'seconds_elapsed': seconds_elapsed,
+            'seconds_remaining': seconds_remaining,
+            'cancelled': self.cancelled,
+            'finished': self.finished
+        }
+
+
+def hashcash_prefix(challenge_data: Dict) -> bytes:
+    '''
+    returns constant part of the hashcash string
+    '''
+    return ('%s:%s:%s:%s:%s:%s:' % (
+        challenge_data['algorithm']['version'],
+        challenge_data['complexity'],
+        challenge_data['timestamp'],
+        challenge_data['algorithm']['resourse'],
+        challenge_data['algorithm']['extension'],
+        challenge_data['random_string'])).encode('utf-8')
+
+
+def hashcash_search(prefix: bytes, complexity: int, start: int, stop: int) -> Optional[int]:
+    '''
+    scans nonces in [start, stop) range and returns the smallest valid one or None
+    '''
+    if Keccak512Batch.is_available():
+        return hashcash_search_batch(prefix, complexity, start, stop)
+
+    if get_backend() in POW_PYTHON_BACKENDS:
+        return hashcash_search_flat(prefix, complexity, start, stop)
+
+    return hashcash_search_hash(prefix, complexity, start, stop)
+
+
+def hashcash_search_hash(prefix: bytes, complexity: int, start: int, stop: int) -> Optional[int]:
+    '''
+    scans nonces in [start, stop) range using the active Keccak512 backend and returns the smallest valid one or None
+    '''
+    zeroes = '0' * complexity
+
+    #absorb the constant prefix once, only the copies of it are finished for every nonce
+    keccak_prefix = Keccak512(prefix)
+
+    #pure-Python backends check the leading lanes without building the hex digest
+    if hasattr(keccak_prefix, 'digest_has_zero_prefix'):
+        for pow_number in range(start, stop):
+            keccak_hash = keccak_prefix.copy()
+            keccak_hash.update(str(pow_number).encode('utf-8'))
+
+            if keccak_hash.digest_has_zero_prefix(complexity):
+                return pow_number
+
+        return None
+
+    for pow_number in range(start, stop):
+        keccak_hash = keccak_prefix.copy()
+        keccak_hash.update(str(pow_number).encode('utf-8'))
+
+        if keccak_hash.hexdigest().startswith(zeroes):
+            return pow_number
+
+    return None
+
+
+def hashcash_search_flat(prefix: bytes, complexity: int, start: int, stop: int) -> Optional[int]:
+    '''
+    scans nonces in [start, stop) range using the flat Keccak engine and returns the smallest valid one or None
+
+    The last block is kept in a mutable buffer with the nonce as ASCII digits which are incremented in place,
+    so only the lanes covering the nonce are reloaded for every candidate.
+    '''
+    masks = zero_prefix_masks(complexity)
+
+    #absorb the constant prefix once
+    state = KeccakFlatState(576, 1600)
+    absorbed = len(prefix) - len(prefix) % state.bitrate_bytes
+    for offset in range(0, absorbed, state.bitrate_bytes):
+        state.absorb(prefix[offset:offset + state.bitrate_bytes])
+        keccak_f1600_flat(state)
+    tail = prefix[absorbed:]
+
+    #nonces of the same length share the buffer layout
+    while start < stop:
+        length_stop = min(stop, 10 ** len(str(start)))
+
+        nonce_begin = len(tail)
+        nonce_end = nonce_begin + len(str(start))
+
+        #nonce and padding do not fit into the last block
+        if nonce_end >= state.bitrate_bytes:
+            pow_number = hashcash_search_hash(prefix, complexity, start, length_stop)
+            if pow_number is not None:
+                return pow_number
+            start = length_stop
+            continue
+
+        block = bytearray(state.bitrate_bytes)
+        block[:nonce_begin] = tail
+        block[nonce_begin:nonce_end] = str(start).encode('utf-8')
+        block[nonce_end] |= 0x01
+        block[-1] |= 0x80
+
+        #lanes which do not depend on the nonce are mixed in once
+        lanes_nonce = range(nonce_begin // 8, (nonce_end - 1) // 8 + 1)
+        base = state.s[:]
+        for lane, value in enumerate(state.rate_struct.unpack(block)):
+            if lane not in lanes_nonce:
+                base[lane] ^= value
+
+        work = state.copy()
+        for pow_number in range(start, length_stop):
+            lanes = base[:]
+            for lane in lanes_nonce:
+                lanes[lane] ^= int.from_bytes(block[lane * 8:lane * 8 + 8], 'little')
+
+            work.s = lanes
+            keccak_f1600_flat(work)
+
+            for lane, mask in masks:
+                if lanes[lane] & mask:
+                    break
+            else:
+                return pow_number
+
+            #increment ASCII nonce in place
+            digit = nonce_end - 1
+            while block[digit] == 0x39:
+                block[digit] = 0x30
+                digit -= 1
+            block[digit] += 1
+
+        start = length_stop
+
+    return None
+
+
+def hashcash_search_batch(prefix: bytes, complexity: int, start: int, stop: int) -> Optional[int]:
+    '''
+    scans nonces in [start, stop) range at once using numpy and returns the smallest valid one or None
+    '''
+    keccak_batch = Keccak512Batch(prefix)
+
+    #nonces of the same length are hashed together
+    while start < stop:
+        length_stop = min(stop, 10 ** len(str(start)))
+
+        mask = keccak_batch.zero_prefix_mask([str(pow_number).encode('utf-8') for pow_number in range(start, length_stop)], complexity)
+        if mask.any():
+            return start + int(mask.argmax())
+
+        start = length_stop
+
+    return None
+
+
+def hashcash_solve(challenge_data: Dict, progress: HashcashProgress = None) -> Optional[int]:
+    '''
+    calculates solution for proof-of-work challenge in the current thread, returns None if cancelled
+    '''
+    prefix = hashcash_prefix(challenge_data)
+    complexity = challenge_data['complexity']
+
+    if progress is None:
+        progress = HashcashProgress(complexity)
+
+    start = 0
+    while not progress.cancelled:
+        pow_number = hashcash_search(prefix, complexity, start, start + POW_BLOCK_SIZE)
+        if pow_number is not None:
+            progress.add_nonces(pow_number - start + 1)
+            progress.finish()
+            return pow_number
+
+        progress.add_nonces(POW_BLOCK_SIZE)
+        start += POW_BLOCK_SIZE
+
+    return None
+
+
+def hashcash_solve_parallel(challenge_data: Dict, progress: HashcashProgress = None, workers: int = None) -> Optional[int]:
+    '''
+    calculates solution for proof-of-work challenge using worker processes, returns None if cancelled
+
+    Nonce space is split into blocks of POW_BLOCK_SIZE which are handed out in ascending order.
+    Once a solution is found, blocks above it are cancelled and blocks below it are awaited,
+    so the result is the same smallest nonce which hashcash_solve() returns.
+    '''
+    prefix = hashcash_prefix(challenge_data)
+    complexity = challenge_data['complexity']
+
+    if progress is None:
+        progress = HashcashProgress(complexity)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    result = None
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+        pending = dict()
+        next_start = 0
+
+        while True:
+            #keep every worker busy until the first solution appears
+            while result is None and not progress.cancelled and len(pending) < workers * 2:
+                future = executor.submit(hashcash_search, prefix, complexity, next_start, next_start + POW_BLOCK_SIZE)
+                pending[future] = next_start
+                next_start += POW_BLOCK_SIZE
+
+            if not pending:
+                break
+
+            done, _ = concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                pow_number = future.result()
+                progress.add_nonces(POW_BLOCK_SIZE)
+                if pow_number is not None and (result is None or pow_number < result):
+                    result = pow_number
+
+            #blocks above the solution are not needed anymore, blocks below it still may contain smaller nonce
+            for future, start in list(pending.items()):
+                if progress.cancelled or (result is not None and start > result):
+                    future.cancel()
+                    pending.pop(future)
+
+    if progress.cancelled:
+        return None
+
+    progress.finish()
+    logging.getLogger('wgc_pow').info('hashcash_solve_parallel: solved complexity %s with %s workers' % (complexity, workers))
+    return result
+
+
+_calibration = None
+
+
+def hashcash_calibrate() -> Dict:
+    '''
+    measures hashcash_search speed on this machine, the result is measured once and cached
+    '''
+    global _calibration
+    if _calibration is not None:
+        return _calibration
+
+    #complexity 64 is never satisfied, so the whole range is scanned
+    nonces = 64
+    while True:
+        time_start = time.perf_counter()
+        hashcash_search(b'1:64:0:calibration::0123456789abcdef:', 64, 0, nonces)
+        elapsed = time.perf_counter() - time_start
+
+        if elapsed >= POW_CALIBRATION_SECONDS or nonces >= POW_BLOCK_SIZE * 64:
+            break
+        nonces *= 2
+
+    _calibration = {
+        'nonces_per_second': nonces / elapsed,
+        'workers': os.cpu_count() or 1,
+        'backend': get_backend(),
+        'batch': Keccak512Batch.is_available()
+    }
+
+    logging.getLogger('wgc_pow').info('hashcash_calibrate: %s' % _calibration)
+    return _calibration
+
+
+def hashcash_estimate(complexity: int, calibration: Dict, strategy: str) -> Dict:
+    '''
+    returns expected and 95th percentile time to solution in seconds for the given strategy
+    '''
+    rate = calibration['nonces_per_second']
+    if strategy == POW_STRATEGY_MULTIPROCESS:
+        rate *= calibration['workers']
+
+    #amount of tried nonces is geometrically distributed with p = 16^-complexity
+    probability = 16 ** -complexity
+    nonces_p95 = math.log(0.05) / math.log1p(-probability) if probability < 1 else 1
+
+    return {
+        'expected_seconds': (1 / probability) / rate,
+        'p95_seconds': nonces_p95 / rate
+    }
+
+
+def hashcash_select_strategy(complexity: int, calibration: Dict) -> str:
+    '''
+    picks the cheapest strategy to solve the challenge of given complexity
+    '''
+    expected_seconds = hashcash_estimate(complexity, calibration, POW_STRATEGY_INLINE)['expected_seconds']
+
+    if expected_seconds < POW_INLINE_SECONDS:
+        return POW_STRATEGY_INLINE
+
+    if expected_seconds > POW_MULTIPROCESS_SECONDS and calibration['workers'] > 1:
+        return POW_STRATEGY_MULTIPROCESS
+
+    return POW_STRATEGY_EXECUTOR
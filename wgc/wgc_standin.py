@@ -0,0 +1,355 @@
+# (c) 2019-2020 Mikhail Paulyshka
+# SPDX-License-Identifier: MIT
+
+'''
+Local stand-in for Wargaming backends used for offline benchmarks and load tests
+
+Implements WGNI challenge/token/token1/account info, WGCPS fetchProductList with 202 + Location flow,
+product URIs, WGUSCS showroom, WGUS metadata and PAPI account/info on a single host.
+
+Usage: python -m wgc.wgc_standin [--port PORT] [--latency SECONDS] [--error-rate RATE] [--catalog-size COUNT]
+
+Point the plugin at it with WGC(http_host_override = 'http://127.0.0.1:PORT').
+'''
+
+import argparse
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, List
+
+import aiohttp
+import aiohttp.web
+
+from .wgc_constants import GAMES_F2P, WGCRealms
+from .wgc_keccak import Keccak512
+from .wgc_pow import hashcash_prefix
+
+class WgcStandinServer():
+    STANDIN_HOST = '127.0.0.1'
+    STANDIN_PORT = 13338
+
+    #application realm of the generated catalog, matches every account realm
+    CATALOG_REALM = 'WW'
+
+    #amount of issued challenges which are accepted in token requests
+    CHALLENGES_KEPT = 16
+
+    def __init__(self, host: str = STANDIN_HOST, port: int = STANDIN_PORT, *, latency: float = 0.0, error_rate: float = 0.0,
+                 catalog_size: int = 20, polls: int = 1, complexity: int = 2, retry_interval: int = 1, seed: int = 0):
+        '''
+        latency is mean response delay in seconds, error_rate is probability of a transient failure,
+        polls is amount of 202 responses returned before the product list is ready
+        '''
+        self.__logger = logging.getLogger('wgc_standin')
+
+        self.__host = host
+        self.__port = port
+
+        self.__latency = latency
+        self.__error_rate = error_rate
+        self.__polls = polls
+        self.__complexity = complexity
+        self.__retry_interval = retry_interval
+
+        #same seed gives the same catalog and the same sequence of failures
+        self.__random = random.Random(seed)
+        self.__catalog = ['SG%03d' % index for index in range(catalog_size)]
+
+        self.__challenges = list()
+        self.__tokens = dict()
+        self.__product_lists = dict()
+
+        self.__app = aiohttp.web.Application(middlewares = [self.__middleware])
+        self.__runner = None
+
+        self.__app.add_routes([
+            aiohttp.web.get ('/id/api/v2/account/credentials/create/oauth/token/challenge/' , self.handle_wgni_challenge_get  ),
+            aiohttp.web.post('/id/api/v2/account/credentials/create/oauth/token/'           , self.handle_wgni_token_post      ),
+            aiohttp.web.post('/id/api/v2/account/credentials/create/token1/'                , self.handle_wgni_token1_post     ),
+            aiohttp.web.post('/id/api/v2/account/info/'                                     , self.handle_wgni_accountinfo_post),
+
+            aiohttp.web.post('/platform/api/v1/fetchProductList'                            , self.handle_wgcps_productlist_post),
+            aiohttp.web.get ('/platform/api/v1/fetchProductList/{list_id}'                  , self.handle_wgcps_productlist_get ),
+            aiohttp.web.get ('/platform/api/v1/product/{app_gameid}'                        , self.handle_wgcps_product_get     ),
+
+            aiohttp.web.get ('/api/v16/content/showroom/'                                   , self.handle_wguscs_showroom_get   ),
+            aiohttp.web.get ('/wgus/{app_gameid}/{tail:.*}'                                 , self.handle_wgus_metadata_get     ),
+
+            aiohttp.web.get ('/wot/account/info/'                                           , self.handle_papi_accountinfo_get  ),
+            aiohttp.web.get ('/wgn/account/info/'                                           , self.handle_papi_accountinfo_get  ),
+        ])
+
+    #
+    # Info
+    #
+
+    def get_url(self) -> str:
+        return 'http://%s:%s' % (self.__host, self.__port)
+
+    def get_catalog(self) -> List[str]:
+        return list(self.__catalog)
+
+    #
+    # Start/Stop
+    #
+
+    async def start(self) -> None:
+        self.__runner = aiohttp.web.AppRunner(self.__app)
+        await self.__runner.setup()
+
+        site = aiohttp.web.TCPSite(self.__runner, self.__host, self.__port)
+        await site.start()
+        self.__logger.info('start: listening on %s' % self.get_url())
+
+    async def shutdown(self) -> None:
+        if self.__runner is not None:
+            await self.__runner.cleanup()
+            self.__runner = None
+
+    #
+    # Latency and failures
+    #
+
+    @aiohttp.web.middleware
+    async def __middleware(self, request, handler):
+        if self.__latency > 0:
+            await asyncio.sleep(self.__random.expovariate(1 / self.__latency))
+
+        if self.__random.random() < self.__error_rate:
+            #WGCPS asks to come back later, other backends fail at the gateway
+            if request.path.startswith('/platform/'):
+                return aiohttp.web.json_response({'status': 'error', 'errors': [
+                    {'code': 'platform_error', 'context': {'result_code': 'EXCEPTION'}},
+                    {'code': 'retry', 'context': {'interval': self.__retry_interval}}]}, status = 500)
+
+            return aiohttp.web.Response(status = self.__random.choice([502, 503, 504]), text = 'stand-in failure')
+
+        return await handler(request)
+
+    #
+    # WGNI
+    #
+
+    async def handle_wgni_challenge_get(self, request):
+        return aiohttp.web.json_response({'pow': self.__get_challenge()})
+
+    async def handle_wgni_token_post(self, request):
+        data = await request.post()
+
+        if data.get('grant_type') == 'urn:wargaming:params:oauth:grant-type:access-token':
+            token = self.__tokens.get(data.get('access_token'))
+            if token is None:
+                return aiohttp.web.json_response({'error': 'invalid_grant', 'error_description': 'Invalid access_token parameter value.'}, status = 400)
+
+            return aiohttp.web.json_response({'access_token': self.__create_token(token['user']), 'token_type': 'Bearer', 'user': token['user'], 'expires_in': 86400})
+
+        if not data.get('username'):
+            return aiohttp.web.json_response({'error': 'invalid_request', 'error_description': 'Invalid username parameter value.'}, status = 400)
+
+        if not data.get('password'):
+            return aiohttp.web.json_response({'error': 'invalid_request', 'error_description': 'Request is missing password parameter.'}, status = 400)
+
+        if not self.__check_pow(data.get('pow')):
+            return aiohttp.web.json_response({'error': 'invalid_request', 'error_description': 'Invalid pow parameter value.'}, status = 400)
+
+        user = self.__get_account_id(data['username'])
+        return aiohttp.web.json_response({'access_token': self.__create_token(user), 'token_type': 'Bearer', 'user': user, 'expires_in': 86400})
+
+    async def handle_wgni_token1_post(self, request):
+        data = await request.post()
+        if data.get('access_token') not in self.__tokens:
+            return aiohttp.web.json_response({'status': 'error', 'errors': [{'code': 'invalid', 'context': {'field': 'access_token'}}]}, status = 400)
+
+        return aiohttp.web.json_response({'token': '%032x' % self.__random.getrandbits(128), 'requested_for': data.get('requested_for')})
+
+    async def handle_wgni_accountinfo_post(self, request):
+        token = self.__get_bearer_token(request)
+        if token is None:
+            return aiohttp.web.json_response({'status': 'error', 'errors': [{'code': 'unauthorized'}]}, status = 401)
+
+        return aiohttp.web.json_response({'nickname': 'standin_%s' % token['user']})
+
+    #
+    # WGCPS
+    #
+
+    async def handle_wgcps_productlist_post(self, request):
+        content = await request.json()
+
+        list_id = '%016x' % self.__random.getrandbits(64)
+        self.__product_lists[list_id] = {'account_id': content.get('account_id'), 'polls': self.__polls}
+        return self.__get_productlist_response(list_id)
+
+    async def handle_wgcps_productlist_get(self, request):
+        list_id = request.match_info['list_id']
+        if list_id not in self.__product_lists:
+            return aiohttp.web.json_response({'status': 'error', 'errors': [{'code': 'not_found'}]}, status = 404)
+
+        return self.__get_productlist_response(list_id)
+
+    async def handle_wgcps_product_get(self, request):
+        app_gameid = request.match_info['app_gameid']
+        if app_gameid not in self.__catalog:
+            return aiohttp.web.json_response({'status': 'error', 'errors': [{'code': 'not_found'}]}, status = 404)
+
+        return aiohttp.web.json_response({'metadata': {'wgc': {
+            'application_id': {'data': self.__get_application_id(app_gameid, self.CATALOG_REALM)},
+            'update_url': {'data': self.__get_update_url(app_gameid)}
+        }}})
+
+    def __get_productlist_response(self, list_id: str):
+        product_list = self.__product_lists[list_id]
+        if product_list['polls'] > 0:
+            product_list['polls'] -= 1
+            return aiohttp.web.Response(status = 202, headers = {
+                'Location': '%s/platform/api/v1/fetchProductList/%s' % (self.get_url(), list_id),
+                'Retry-After': '0'})
+
+        self.__product_lists.pop(list_id)
+        product_uris = ['%s/platform/api/v1/product/%s' % (self.get_url(), app_gameid) for app_gameid in self.__catalog]
+        return aiohttp.web.json_response({'status': 'ok', 'data': {'product_uris': product_uris}})
+
+    #
+    # WGUSCS/WGUS
+    #
+
+    async def handle_wguscs_showroom_get(self, request):
+        showcase = list()
+
+        #free-to-play games are shown for every realm
+        for app_gameid in GAMES_F2P:
+            showcase.append({'game_name': self.__get_game_name(app_gameid), 'instances': [
+                {'application_id': self.__get_application_id(app_gameid, realm), 'update_service_url': self.__get_update_url(app_gameid)}
+                for realm in WGCRealms]})
+
+        #purchased products are passed as application_id@update_url
+        for product in request.query.getall('showcase_products', []):
+            application_id, _, update_url = product.partition('@')
+            showcase.append({'game_name': self.__get_game_name(application_id.split('.')[0]), 'instances': [
+                {'application_id': application_id, 'update_service_url': update_url}]})
+
+        return aiohttp.web.json_response({'status': 'ok', 'data': {'showcase': showcase}})
+
+    async def handle_wgus_metadata_get(self, request):
+        app_gameid = request.match_info['app_gameid']
+        application_id = request.query.get('guid', self.__get_application_id(app_gameid, self.CATALOG_REALM))
+
+        return aiohttp.web.Response(content_type = 'application/xml', text = '''<?xml version="1.0" encoding="utf-8"?>
+<protocol name="metadata" version="6.4">
+  <predefined_section>
+    <app_id>%s</app_id>
+    <shortcut_name>%s</shortcut_name>
+    <executables>
+      <executable>%s.exe</executable>
+      <executable emul="wgc_mac">%s.exe</executable>
+    </executables>
+    <mutex_name>%s_mutex</mutex_name>
+    <client_types default="sd">
+      <client_type id="sd">
+        <client_parts>
+          <client_part id="client"/>
+        </client_parts>
+      </client_type>
+    </client_types>
+    <supported_languages>EN,RU</supported_languages>
+    <default_language>EN</default_language>
+  </predefined_section>
+</protocol>
+''' % (application_id, self.__get_game_name(app_gameid), app_gameid, app_gameid, app_gameid))
+
+    #
+    # PAPI
+    #
+
+    async def handle_papi_accountinfo_get(self, request):
+        account_ids = [account_id for account_id in request.query.get('account_id', '').split(',') if account_id]
+        return aiohttp.web.json_response({'status': 'ok', 'meta': {'count': len(account_ids)},
+            'data': {account_id: {'account_id': int(account_id), 'nickname': 'standin_%s' % account_id} for account_id in account_ids}})
+
+    #
+    # Helpers
+    #
+
+    def __get_challenge(self) -> Dict:
+        challenge = {
+            'algorithm': {'name': 'hashcash', 'version': 1, 'resourse': 'wgni', 'extension': ''},
+            'complexity': self.__complexity,
+            'timestamp': int(time.time()),
+            'random_string': '%016x' % self.__random.getrandbits(64)
+        }
+
+        self.__challenges = self.__challenges[-(self.CHALLENGES_KEPT - 1):] + [challenge]
+        return challenge
+
+    def __check_pow(self, pow_number: str) -> bool:
+        '''
+        checks that the number solves one of the recently issued challenges
+        '''
+        if pow_number is None or not pow_number.isdigit():
+            return False
+
+        for challenge in self.__challenges:
+            keccak_hash = Keccak512(hashcash_prefix(challenge) + pow_number.encode('utf-8'))
+            if keccak_hash.hexdigest().startswith('0' * challenge['complexity']):
+                return True
+
+        return False
+
+    def __create_token(self, user: int) -> str:
+        token = '%032x' % self.__random.getrandbits(128)
+        self.__tokens[token] = {'user': user}
+        return token
+
+    def __get_bearer_token(self, request) -> Dict:
+        #Authorization: Bearer <access_token>:<exchange_code>
+        authorization = request.headers.get('Authorization', '')
+        if not authorization.startswith('Bearer '):
+            return None
+
+        return self.__tokens.get(authorization[len('Bearer '):].split(':')[0])
+
+    def __get_account_id(self, username: str) -> int:
+        #stable account in the EU SPA range
+        return 500000000 + sum(username.encode('utf-8')) % 100000
+
+    def __get_application_id(self, app_gameid: str, realm: str) -> str:
+        return '%s.%s.PRODUCTION' % (app_gameid, realm)
+
+    def __get_update_url(self, app_gameid: str) -> str:
+        return '%s/wgus/%s' % (self.get_url(), app_gameid)
+
+    def __get_game_name(self, app_gameid: str) -> str:
+        return 'Stand-in %s' % app_gameid
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Local stand-in for Wargaming backends')
+    parser.add_argument('--host', default = WgcStandinServer.STANDIN_HOST, help = 'address to listen on')
+    parser.add_argument('--port', type = int, default = WgcStandinServer.STANDIN_PORT, help = 'port to listen on')
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'mean response delay in seconds')
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = 'probability of a transient failure')
+    parser.add_argument('--catalog-size', type = int, default = 20, help = 'amount of purchased products')
+    parser.add_argument('--polls', type = int, default = 1, help = 'amount of 202 responses before the product list is ready')
+    parser.add_argument('--complexity', type = int, default = 2, help = 'proof-of-work complexity')
+    parser.add_argument('--seed', type = int, default = 0, help = 'seed of catalog and failures')
+    args = parser.parse_args()
+
+    logging.basicConfig(level = logging.INFO)
+
+    server = WgcStandinServer(args.host, args.port, latency = args.latency, error_rate = args.error_rate,
+                              catalog_size = args.catalog_size, polls = args.polls, complexity = args.complexity, seed = args.seed)
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(server.start())
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.shutdown())
+
+
+if __name__ == '__main__':
+    main()
@@ -2,15 +2,15 @@
 # SPDX-License-Identifier: MIT
 
 import asyncio
-import json
 import logging
 import random
 import string
-from typing import Dict
+import time
+from typing import Dict, List
 
 from .wgc_constants import WGCAuthorizationResult, WGCRealms
 from .wgc_http import WgcHttp
-from .wgc_keccak import Keccak512
+from .wgc_pow import POW_STRATEGY_INLINE, POW_STRATEGY_MULTIPROCESS, HashcashProgress, hashcash_calibrate, hashcash_select_strategy, hashcash_solve, hashcash_solve_parallel
 
 class WgcWgni:
     '''
@@ -25,6 +25,13 @@ class WgcWgni:
     WGNI_URL_TOKEN1 = '/id/api/v2/account/credentials/create/token1/'
     WGNI_URL_ACCOUNTINFO = '/id/api/v2/account/info/'
 
+    POW_TIMEOUT = 180
+
+    #age of the challenge in seconds after which pre-solved proof-of-work is not used
+    POW_PRESOLVE_MAX_AGE = 60
+    #amount of realms for which challenges are solved before the login form is submitted
+    POW_PRESOLVE_REALMS = 2
+
     def __init__(self, http : WgcHttp, tracking_id : str = ''):
         self.__logger = logging.getLogger('wgc_auth')
 
@@ -34,9 +41,15 @@ class WgcWgni:
 
         self.__login_info = None
         self.__login_info_temp = None
+
+        self.__pow_progress = None
+        self.__pow_presolved = dict()
+        self.__pow_presolved_taken = None
+        self.__pow_prefetch_task = None
  
     async def shutdown(self):
-        pass
+        self.cancel_pow()
+        self.__oauth_challenge_prefetch_cancel()
 
     #
     # Account Info Storage
@@ -146,13 +159,13 @@ class WgcWgni:
 
         response = await self.__http.request_post_simple(
             'wgnet', self.__login_info['realm'], self.WGNI_URL_ACCOUNTINFO, 
-            data = { 'fields' : 'nickname' })
+            data = { 'fields' : 'nickname' }, endpoint = 'wgnet.accountInfo')
         
         if response.status != 200:
             self.__logger.error('__request_account_info: error on retrieving account info: %s' % response.text)
             return None
 
-        return json.loads(response.text)
+        return response.json()
 
 
     #
@@ -166,16 +179,19 @@ class WgcWgni:
 
         self.__login_info_temp = {'realm': realm, 'email': email, 'password': password}
 
-        challenge_data = await self.__oauth_challenge_get(realm)
-        if not challenge_data:
-            self.__logger.error('do_auth_emailpass: failed to get challenge')
-            return WGCAuthorizationResult.FAILED
-
-        #calculate proof of work
-        pow_number = self.__oauth_challenge_calculate(challenge_data)
-        if not pow_number:
-            self.__logger.error('do_auth_emailpass: failed to calculate challenge')
-            return WGCAuthorizationResult.FAILED
+        #use proof of work calculated while the user was typing credentials
+        pow_number = await self.__oauth_challenge_take_presolved(realm)
+        if pow_number is None:
+            challenge_data = await self.__oauth_challenge_get(realm)
+            if not challenge_data:
+                self.__logger.error('do_auth_emailpass: failed to get challenge')
+                return WGCAuthorizationResult.FAILED
+
+            #calculate proof of work
+            pow_number = await self.__oauth_challenge_calculate(challenge_data)
+            if pow_number is None:
+                self.__logger.error('do_auth_emailpass: failed to calculate challenge')
+                return WGCAuthorizationResult.FAILED
         self.__login_info_temp['pow_number'] = pow_number
 
         #try to get token
@@ -305,42 +321,184 @@ class WgcWgni:
         '''
         request authentication challenge and return proof-of-work
         '''
-        r = await self.__http.request_get_simple('wgnet', realm, self.OUATH_URL_CHALLENGE)
+        r = await self.__http.request_get_simple('wgnet', realm, self.OUATH_URL_CHALLENGE, endpoint = 'wgnet.challenge')
         if r.status != 200:
             self.__logger.error('__oauth_challenge_get: error %s, content: %s' % (r.status, r.text))
             return None
 
-        return json.loads(r.text)['pow']
+        return r.json()['pow']
 
 
-    def __oauth_challenge_calculate(self, challenge_data):
+    async def __oauth_challenge_calculate(self, challenge_data):
         '''
-        calculates solution for proof-of-work challenge
+        calculates solution for proof-of-work challenge outside of the event loop
         '''
 
         if challenge_data['algorithm']['name'] != 'hashcash' :
             self.__logger.error('__oauth_challenge_calculate: unknown proof-of-work algorithm')
             return None
 
-        prefix = '0' * challenge_data['complexity']
-        hashcash_str = '%s:%s:%s:%s:%s:%s:' % (
-            challenge_data['algorithm']['version'], 
-            challenge_data['complexity'], 
-            challenge_data['timestamp'], 
-            challenge_data['algorithm']['resourse'], 
-            challenge_data['algorithm']['extension'], 
-            challenge_data['random_string'])
-        hashcash_str = hashcash_str.encode('utf-8')
+        #abort calculation of the previous login attempt
+        self.cancel_pow()
+        progress = HashcashProgress(challenge_data['complexity'])
+        self.__pow_progress = progress
+
+        try:
+            return await asyncio.wait_for(self.__oauth_challenge_solve(challenge_data, progress), self.POW_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.__logger.error('__oauth_challenge_calculate: timed out after %s seconds: %s' % (self.POW_TIMEOUT, progress.get_status()))
+            progress.cancel()
+            return None
+        except asyncio.CancelledError:
+            progress.cancel()
+            raise
+
+
+    async def __oauth_challenge_solve(self, challenge_data, progress: HashcashProgress):
+        '''
+        solves the challenge using the strategy picked from calibrated hash rate of this machine
+        '''
+        loop = asyncio.get_event_loop()
+
+        calibration = await loop.run_in_executor(None, hashcash_calibrate)
+        strategy = hashcash_select_strategy(challenge_data['complexity'], calibration)
+        self.__logger.info('__oauth_challenge_solve: complexity %s, strategy %s' % (challenge_data['complexity'], strategy))
+
+        #cheap challenges are not worth the thread switch
+        if strategy == POW_STRATEGY_INLINE:
+            return hashcash_solve(challenge_data, progress)
+
+        #spread the search over all cores when it is worth the cost of starting worker processes
+        solver = hashcash_solve_parallel if strategy == POW_STRATEGY_MULTIPROCESS else hashcash_solve
+        return await loop.run_in_executor(None, solver, challenge_data, progress)
+
+
+    def prefetch_challenges(self, realms: List[str]) -> None:
+        '''
+        starts fetching and solving challenges for the most likely realms in background
+        '''
+        if self.__pow_prefetch_task is not None and not self.__pow_prefetch_task.done():
+            return
+
+        self.__pow_prefetch_task = asyncio.create_task(self.__oauth_challenge_prefetch([realm.upper() for realm in realms[:self.POW_PRESOLVE_REALMS]]))
+
+
+    async def __oauth_challenge_prefetch(self, realms: List[str]) -> None:
+        #realms are solved one by one, the most likely goes first
+        for realm in realms:
+            presolved = self.__pow_presolved.get(realm)
+            if presolved is not None and self.__oauth_challenge_presolved_is_fresh(presolved):
+                continue
+
+            presolved = {'time': time.monotonic(), 'task': None, 'progress': None}
+            presolved['task'] = asyncio.ensure_future(self.__oauth_challenge_presolve(realm, presolved))
+            self.__pow_presolved[realm] = presolved
+
+            #cancellation of the prefetch does not cancel the solution which is already taken by login
+            await asyncio.shield(presolved['task'])
+
+
+    async def __oauth_challenge_presolve(self, realm: str, presolved: Dict):
+        '''
+        returns proof of work for a new challenge of the realm or None
+        '''
+        try:
+            challenge_data = await self.__oauth_challenge_get(realm)
+            if challenge_data and challenge_data['algorithm']['name'] == 'hashcash':
+                presolved['progress'] = HashcashProgress(challenge_data['complexity'])
+                return await self.__oauth_challenge_solve(challenge_data, presolved['progress'])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.__logger.exception('__oauth_challenge_presolve: failed to presolve challenge for realm %s' % realm)
+
+        return None
+
+
+    def __oauth_challenge_presolve_cancel(self, presolved: Dict) -> None:
+        presolved['task'].cancel()
+        if presolved['progress'] is not None:
+            presolved['progress'].cancel()
 
-        pow_number = 0
-        while True:
-            keccak_hash = Keccak512()
-            keccak_hash.update(hashcash_str+str(pow_number).encode('utf-8'))
 
-            if keccak_hash.hexdigest().startswith(prefix):
-                return pow_number
+    def __oauth_challenge_prefetch_cancel(self) -> None:
+        '''
+        stops prefetch and cancels solutions which are not taken by login
+        '''
+        if self.__pow_prefetch_task is not None:
+            self.__pow_prefetch_task.cancel()
+
+        for presolved in self.__pow_presolved.values():
+            self.__oauth_challenge_presolve_cancel(presolved)
+
+        self.__pow_presolved.clear()
+
+
+    def __oauth_challenge_presolved_is_fresh(self, presolved: Dict) -> bool:
+        return time.monotonic() - presolved['time'] < self.POW_PRESOLVE_MAX_AGE
+
+
+    async def __oauth_challenge_take_presolved(self, realm: str):
+        '''
+        returns proof of work for still fresh challenge which was solved in background or None
+        '''
+        presolved = self.__pow_presolved.pop(realm.upper(), None)
+
+        #login has started, so solutions for the other realms are not needed and do not compete for CPU
+        self.__oauth_challenge_prefetch_cancel()
+
+        if presolved is None:
+            return None
+
+        if not self.__oauth_challenge_presolved_is_fresh(presolved):
+            self.__oauth_challenge_presolve_cancel(presolved)
+            return None
+
+        self.__pow_presolved_taken = presolved
+        if not presolved['task'].done():
+            self.__pow_progress = presolved['progress']
+
+        try:
+            pow_number = await asyncio.wait_for(asyncio.shield(presolved['task']), self.POW_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.__logger.error('__oauth_challenge_take_presolved: timed out on realm %s' % realm)
+            self.__oauth_challenge_presolve_cancel(presolved)
+            return None
+        except asyncio.CancelledError:
+            #solution is cancelled by cancel_pow(), the waiting login itself goes on
+            if not presolved['task'].cancelled():
+                raise
+            return None
+        finally:
+            self.__pow_presolved_taken = None
+
+        if pow_number is None or not self.__oauth_challenge_presolved_is_fresh(presolved):
+            return None
+
+        self.__logger.info('__oauth_challenge_take_presolved: using presolved challenge for realm %s' % realm)
+        return pow_number
+
+
+    def get_pow_progress(self) -> Dict:
+        '''
+        returns progress of the current proof-of-work calculation
+        '''
+        if self.__pow_progress is None:
+            return None
+
+        return self.__pow_progress.get_status()
+
+
+    def cancel_pow(self) -> None:
+        '''
+        aborts the current proof-of-work calculation, including the background one taken by login
+        '''
+        if self.__pow_progress is not None:
+            self.__pow_progress.cancel()
 
-            pow_number = pow_number + 1
+        #taken solution may still be fetching its challenge and have no progress yet
+        if self.__pow_presolved_taken is not None:
+            self.__oauth_challenge_presolve_cancel(self.__pow_presolved_taken)
 
 
     async def __oauth_token_get_bypassword(self, realm, email, password, pow_number, twofactor_token : str = None, otp_code : str = None, use_backup_code : bool = False):
@@ -359,11 +517,11 @@ class WgcWgni:
             else:
                 body['otp_code'] = otp_code
 
-        response = await self.__http.request_post_simple('wgnet', realm, self.OAUTH_URL_TOKEN, data = body)
+        response = await self.__http.request_post_simple('wgnet', realm, self.OAUTH_URL_TOKEN, data = body, endpoint = 'wgnet.token')
         
         result = None
         try:
-            result = json.loads(response.text)
+            result = response.json()
         except Exception:
             self.__logger.exception('__oauth_token_get_bypassword: failed to parse response %s' % response.text)
             return result
@@ -380,13 +538,13 @@ class WgcWgni:
         body['exchange_code'] = ''.join(random.choices(string.digits+'ABCDEF', k=32))
         body['tid'] = self.__tracking_id
 
-        response = await self.__http.request_post_simple('wgnet', realm, self.OAUTH_URL_TOKEN, data = body)
+        response = await self.__http.request_post_simple('wgnet', realm, self.OAUTH_URL_TOKEN, data = body, endpoint = 'wgnet.token')
 
         if response.status != 200:
             self.__logger.error('__oauth_token_get_bytoken: error on receiving token by token: %s because status is %s' % (response.text, response.status))
             return None
 
-        result = json.loads(response.text)
+        result = response.json()
         result['exchange_code'] = body['exchange_code']
 
         return result
@@ -413,14 +571,14 @@ class WgcWgni:
         #send request
         response = await self.__http.request_post_simple(
             'wgnet', self.__login_info['realm'], self.WGNI_URL_TOKEN1, 
-            data = { 'requested_for' : requested_for, 'access_token' : self.__login_info['access_token'] })
+            data = { 'requested_for' : requested_for, 'access_token' : self.__login_info['access_token'] }, endpoint = 'wgnet.token1')
 
         #parse data
         if response.status != 200:
             self.__logger.error('create_token1: error on retrieving token1: %s, %s' % (response.status, response.text))
             return None
 
-        content = json.loads(response.text)
+        content = response.json()
         if content is None:
             self.__logger.error('create_token1: failed parse token1 response (%s, %s)' % (requested_for, response.text))
             return None
@@ -449,5 +607,5 @@ class WgcWgni:
             self.__logger.error('__update_bearer: login info does not contain exchange code')
             return None
 
-        self.__http.update_headers({'Authorization':'Bearer %s:%s' % (self.__login_info['access_token'], self.__login_info['exchange_code'])})
+        self.__http.set_authorization(self.__login_info['realm'], 'Bearer %s:%s' % (self.__login_info['access_token'], self.__login_info['exchange_code']))
 